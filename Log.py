@@ -1,78 +1,286 @@
 import tkinter as tk
 import sys
+import os
+import gzip
+import queue
+import shutil
 import threading
 import atexit
-import time
+from collections import deque
+from itertools import islice
 
-class LogStream:
-    def __init__(self, log_widget, buffer_size=1000, file=None, flush_interval=2.0):
-        self.log_widget = log_widget
-        self.buffer_size = buffer_size
-        self.buffer = []
-        self.file = file
-        self.original_stdout = sys.__stdout__
+# Log file of every GUI mode, a known difficulty takes precedence (see log_file_for)
+MODE_LOGS = {0: 'MASTER', 1: 'INPUT', 2: 'GENERATED', 3: 'GENERATED'}
+
+_STOP = object()        #queue item that ends the writer thread
+
+
+def log_file_for(mode=None, difficulty=None):
+    return f"log_{difficulty or MODE_LOGS.get(mode, 'MASTER')}.txt"
+
+
+def read_lines_before(path, end, count, block=1 << 16):
+    # The last count lines of the file before byte offset end (a line start), read backwards block by block.
+    # Returns the offset where the first of them starts and the lines
+    if count <= 0 or end <= 0:
+        return end, []
+    with open(path, 'rb') as f:
+        start = end
+        data = b''
+        while start > 0 and data.count(b'\n') <= count:
+            step = min(block, start)
+            start -= step
+            f.seek(start)
+            data = f.read(step) + data
+    lines = data.split(b'\n')
+    if not lines[-1]:       #end is a line start, nothing follows the last newline
+        lines.pop()
+    if len(lines) > count:
+        start += sum(len(line) + 1 for line in lines[:-count])
+        lines = lines[-count:]
+    return start, [line.decode('utf-8', 'replace') for line in lines]
+
+
+class LogView:
+    # Bounded log viewer on a Text widget. The writer thread hands text to append(), which only keeps the last
+    # max_lines complete lines in a ring buffer. A Tk timer moves new lines into the widget at most fps times a
+    # second and trims it back to max_lines, so the widget holds max_lines lines at most however much is logged.
+    # page_older() pages backwards through the on-disk log of the LogStream feeding the view, follow() goes live again
+    def __init__(self, text, max_lines=2000, fps=20):
+        self.text = text
+        self.max_lines = max_lines
+        self.ring = deque(maxlen=max_lines)
+        self.partial = ''           #text after the last newline, waiting for the rest of its line
+        self.appended = 0           #lines appended so far
+        self.shown = 0              #value of appended when the widget was last updated
+        self.widget_lines = 0
         self.lock = threading.Lock()
+        self.stream = None          #LogStream writing to this view, set by the stream
+        self.paging_offset = None   #file offset of the oldest line shown while paging, None while following live
+        self.interval = max(1, 1000 // fps)
+        self.text.after(self.interval, self._tick)
+
+    def append(self, text):     #called from the writer thread, never touches Tk
+        with self.lock:
+            lines = (self.partial + text).split('\n')
+            self.partial = lines.pop()
+            self.ring.extend(lines)
+            self.appended += len(lines)
+
+    def follow(self):       #show the live tail again
+        self.paging_offset = None
+        with self.lock:
+            lines = list(self.ring)
+            self.shown = self.appended
+        self._show(lines, replace=True)
+
+    def page_older(self):       #replace the view with the max_lines lines logged before the ones shown
+        path = self.stream.file if self.stream else None
+        if not path or not os.path.exists(path):
+            return
+        if self.paging_offset is None:      #skip the live lines already on screen, they are the end of the file
+            end, _ = read_lines_before(path, os.path.getsize(path), self.widget_lines)
+        else:
+            end = self.paging_offset
+        if end == 0:
+            return
+        self.paging_offset, lines = read_lines_before(path, end, self.max_lines)
+        self._show(lines, replace=True)
+
+    def _tick(self):
+        try:
+            if not self.text.winfo_exists():
+                return
+        except tk.TclError:
+            return  # GUI is gone
+        with self.lock:
+            new = min(self.appended - self.shown, len(self.ring))
+            self.shown = self.appended
+            lines = list(islice(self.ring, len(self.ring) - new, None)) if new else None
+        if lines and self.paging_offset is None:
+            self._show(lines)
+        self.text.after(self.interval, self._tick)
+
+    def _show(self, lines, replace=False):
+        text = self.text
+        try:
+            at_bottom = text.yview()[1] >= 1.0
+            text.config(state='normal')
+            if replace:
+                text.delete('1.0', tk.END)
+                self.widget_lines = 0
+            if lines:
+                text.insert(tk.END, '\n'.join(lines) + '\n')
+                self.widget_lines += len(lines)
+            excess = self.widget_lines - self.max_lines
+            if excess > 0:
+                text.delete('1.0', f'{excess + 1}.0')
+                self.widget_lines = self.max_lines
+            text.config(state='disabled')
+            if at_bottom or replace:
+                text.yview(tk.END)
+        except tk.TclError:
+            pass  # GUI is gone
+
+
+class LogStream:
+    # stdout replacement. write() only puts the message on a bounded queue, a background thread takes it off in
+    # batches and writes each batch once to the terminal, the LogView and a log file that stays open.
+    # When the queue is full the message is dropped and counted (block=False), or write() waits (block=True).
+    # The log file is rotated to <file>.1[.gz] ... <file>.<backups>[.gz] once it grows past max_bytes.
+    def __init__(self, log_widget, file=None, flush_interval=0.1, queue_size=10000, batch_size=4096,
+                 max_bytes=8 << 20, backups=3, compress=True, block=False, echo=True):
+        self.log_widget = log_widget        #LogView, or None
+        if log_widget:
+            log_widget.stream = self
+        self.file = None
+        self.handle = None
+        self.size = 0
+        self.original_stdout = sys.__stdout__ if echo else None
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.compress = compress
+        self.block = block
+        self.dropped = 0
+        self.lock = threading.Lock()        #guards the drop counter, written by any thread
         self.running = True
         self._flush_interval = flush_interval
-        self._flush_event = threading.Event()
+        self.target = file      #file of the last set_file(), the writer thread may not have switched yet
+        self._open(file)
 
-        # Start periodic flushing
-        self._flush_thread = threading.Thread(target=self._auto_flush, daemon=True)
-        self._flush_thread.start()
+        self._writer = threading.Thread(target=self._run, daemon=True)
+        self._writer.start()
 
         # Ensure final flush at exit
-        atexit.register(self._final_flush_and_wait)
+        atexit.register(self.stop)
 
     def write(self, message):
-        with self.lock:
-            self.buffer.append(message)
+        if not message:
+            return 0
+        if not self.running:        #stopped, e.g. after the GUI closed: print straight to the terminal as before
+            try:
+                return (self.original_stdout or sys.__stdout__).write(message)
+            except (OSError, ValueError):
+                return 0
+        try:
+            if self.block:
+                self.queue.put(message)
+            else:
+                self.queue.put_nowait(message)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+        return len(message)
+
+    def flush(self):        #nothing to do, the writer thread drains the queue every flush_interval
+        pass
+
+    def set_file(self, file):       #switch log files, messages written before the switch still go to the old one
+        if self.running and file != self.target:
+            self.target = file
+            self.queue.put(('file', file))
+
+    def stop(self):     #write out everything queued and close the file
+        if not self.running:
+            return
+        self.running = False
+        self.queue.put(_STOP)
+        self._writer.join(timeout=5)
 
-        self.original_stdout.write(message)
-        self.original_stdout.flush()
+    def _run(self):
+        while True:
+            batch = []
+            control = None
+            try:
+                item = self.queue.get(timeout=self._flush_interval)
+                while True:
+                    if not isinstance(item, str):
+                        control = item
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    item = self.queue.get_nowait()
+            except queue.Empty:
+                pass
 
-        if len(self.buffer) >= self.buffer_size:
-            self.flush()
+            self._emit(''.join(batch))
+            if control is _STOP:
+                self._close()
+                return
+            if control is not None:
+                self._close()
+                self._open(control[1])
 
-    def flush(self):
+    def _emit(self, text):
         with self.lock:
-            combined = ''.join(self.buffer)
-            self.buffer.clear()
-
-        if combined:
-            # GUI output (only if GUI still exists)
-            if self.log_widget:
-                try:
-                    self.log_widget.after(0, self._write_to_widget, combined)
-                except Exception:
-                    pass
-
-            # File output
-            if self.file:
-                try:
-                    with open(self.file, 'a') as f:
-                        f.write(combined)
-                except Exception as e:
-                    self.original_stdout.write(f"[LogStream Error] Could not write to file: {e}\n")
-
-    def _write_to_widget(self, text):
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            text += f"[LogStream] dropped {dropped} messages, the log queue was full\n"
+        if not text:
+            return
+
+        if self.original_stdout:
+            try:
+                self.original_stdout.write(text)
+                self.original_stdout.flush()
+            except (OSError, ValueError):
+                self.original_stdout = None
+
+        # GUI output, the view copies it into Tk on its own timer
+        if self.log_widget:
+            self.log_widget.append(text)
+
+        # File output
+        if self.handle:
+            try:
+                self.handle.write(text)
+                self.handle.flush()
+                self.size += len(text)
+                if self.max_bytes and self.size >= self.max_bytes:
+                    self._rotate()
+            except Exception as e:
+                self._report(f"[LogStream Error] Could not write to file: {e}\n")
+
+    def _open(self, file):
+        self.file = file
+        if not file:
+            return
         try:
-            if self.log_widget and self.log_widget.winfo_exists():
-                self.log_widget.config(state='normal')
-                self.log_widget.insert(tk.END, text)
-                self.log_widget.yview(tk.END)
-                self.log_widget.config(state='disabled')
-        except tk.TclError:
-            pass  # GUI is gone
+            self.handle = open(file, 'a', encoding='utf-8')
+            self.size = self.handle.tell()
+        except OSError as e:
+            self.handle = None
+            self._report(f"[LogStream Error] Could not open log file: {e}\n")
 
-    def _auto_flush(self):
-        while self.running:
-            self.flush()
-            time.sleep(self._flush_interval)
+    def _close(self):
+        if self.handle:
+            self.handle.close()
+            self.handle = None
 
-    def _final_flush_and_wait(self):
-        self.running = False
-        self.flush()
-        time.sleep(0.1)  # Give time for final async flush to GUI/file
+    def _rotate(self):      #<file> -> <file>.1, <file>.1 -> <file>.2, ... the oldest backup is overwritten
+        self._close()
+        suffix = '.gz' if self.compress else ''
+        if self.backups:
+            for k in range(self.backups - 1, 0, -1):
+                older = f"{self.file}.{k}{suffix}"
+                if os.path.exists(older):
+                    os.replace(older, f"{self.file}.{k + 1}{suffix}")
+            if self.compress:
+                with open(self.file, 'rb') as src, gzip.open(f"{self.file}.1.gz", 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(self.file)
+            else:
+                os.replace(self.file, f"{self.file}.1")
+        else:
+            os.remove(self.file)
+        self._open(self.file)
+
+    def _report(self, message):     #errors of the writer itself go to the real stderr
+        if sys.__stderr__:
+            sys.__stderr__.write(message)
 
     def __del__(self):
-        self._final_flush_and_wait()
+        self.stop()
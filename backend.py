@@ -1,322 +1,841 @@
-import random
-import copy
+import sys
+import time
 from collections import deque
 
+# Puzzle strings hold one symbol per cell: '0' for a blank, then the values 1..35. A board of order n has n * n
+# values, so 9x9 puzzles use '1'..'9', 16x16 puzzles add 'A'..'G' and 25x25 puzzles 'A'..'P'
+SYMBOLS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+ORDERS = (2, 3, 4, 5)       #supported board orders (box side), the board is order ** 2 x order ** 2 cells
+
+# Translation tables between puzzle strings and the 0..35 byte values held in SudokuCSP.board
+FROM_CHARS = bytes.maketrans(SYMBOLS.encode(), bytes(range(len(SYMBOLS))))
+TO_CHARS = bytes.maketrans(bytes(range(len(SYMBOLS))), SYMBOLS.encode())
+
+class MaskTable(dict):
+    # mask -> f(mask) for domains too wide to tabulate up front (16 values give 65536 masks), an entry is computed
+    # on its first lookup and kept. Indexed exactly like the lists that hold the tables of 9x9 boards. The tables
+    # live as long as their Geometry, so once max_size entries are kept the table starts over instead of growing
+    def __init__(self , f , max_size = 1 << 16):
+        super().__init__()
+        self.f = f
+        self.max_size = max_size
+
+    def __missing__(self , mask):
+        if len(self) >= self.max_size:
+            self.clear()
+        value = self[mask] = self.f(mask)
+        return value
+
+class BitCount:
+    # mask -> domain size for wide boards, int.bit_count is a C call as fast as a lookup, so nothing is kept
+    __getitem__ = staticmethod(int.bit_count)
+
+class LowestValue:
+    # mask -> smallest value for wide boards, computed on every lookup instead of kept
+    def __getitem__(self , mask):
+        return (mask & -mask).bit_length()
+
+class Geometry:
+    # Static tables of a board of order n, built once per order by geometry(). The board has side = n * n values,
+    # rows / columns / boxes of side cells and side * side cells, indexed row * side + col. A domain is a side-bit
+    # int where bit (v - 1) set means value v is still possible. Per cell everything is a tuple lookup, so the work
+    # per search node grows with the 3 * side - 2 * n - 1 peers of a cell, not with the area of the board
+    def __init__(self , order):
+        n = self.order = order
+        side = self.side = n * n
+        size = self.size = side * side
+        self.all_values = (1 << side) - 1
+        self.bit = [0] + [1 << (v - 1) for v in range(1 , side + 1)]       # value -> mask
+        self.cells = tuple(range(size))
+        self.coords = tuple(divmod(cell , side) for cell in self.cells)        # cell index -> (row, col)
+        self.cell_names = tuple(f'r{r}c{c}' for r , c in self.coords)          # cell index -> 'r<row>c<col>', used in trace records
+        self.box_of = [n * (r // n) + c // n for r , c in self.coords]        # cell index -> box index
+        self.rows = tuple(tuple(r * side + c for c in range(side)) for r in range(side))
+        self.cols = tuple(tuple(r * side + c for r in range(side)) for c in range(side))
+        self.boxes = tuple(tuple(cell for cell in self.cells if self.box_of[cell] == b) for b in range(side))
+        self.units = self.rows + self.cols + self.boxes
+        self.units_of = tuple((self.rows[r] , self.cols[c] , self.boxes[self.box_of[r * side + c]]) for r , c in self.coords)    # cell -> its 3 units
+        self.peers = tuple(tuple(sorted(set(sum(units , ())) - {cell})) for cell , units in enumerate(self.units_of))     # cell -> its peers
+        self.arcs = tuple((cell , peer) for cell in self.cells for peer in self.peers[cell])      # every arc exactly once
+        self.arcs_into = tuple(tuple((peer , cell) for peer in self.peers[cell]) for cell in self.cells)     # cell -> arcs pointing at it
+        self.lines = ((self.rows , tuple(r for r , _ in self.coords)) , (self.cols , tuple(c for _ , c in self.coords)))    # (lines, cell -> line)
+
+        # Value counts packed `field` bits per value into one int, field v - 1 holding the count of value v.
+        # Summing spread over the domains of a cell's peers counts, for every value at once, how many can still take it
+        self.field = len(self.peers[0]).bit_length()
+        self.field_mask = (1 << self.field) - 1
+        self.field_shift = [0] + [self.field * (v - 1) for v in range(1 , side + 1)]      # value -> bit offset of its field
+
+        values = range(1 , side + 1)
+        bit , field_shift = self.bit , self.field_shift
+        popcount = int.bit_count
+        lowest_value = lambda mask: (mask & -mask).bit_length()
+        mask_values = lambda mask: tuple(v for v in values if mask & bit[v])
+        spread = lambda mask: sum(1 << field_shift[v] for v in values if mask & bit[v])
+        if side <= 9:       #every mask tabulated up front
+            masks = range(self.all_values + 1)
+            self.popcount = [popcount(mask) for mask in masks]                  # mask -> domain size
+            self.lowest_value = [lowest_value(mask) for mask in masks]          # mask -> smallest value
+            self.mask_values = [mask_values(mask) for mask in masks]            # mask -> values
+            self.spread = [spread(mask) for mask in masks]                      # mask -> 1 in each of its fields
+        else:
+            self.popcount = BitCount()
+            self.lowest_value = LowestValue()
+            self.mask_values = MaskTable(mask_values)
+            self.spread = MaskTable(spread)
+
+    def value_counts(self , domains , cells):      #packed count of the cells whose domain still has each value
+        return sum(map(self.spread.__getitem__ , map(domains.__getitem__ , cells)))
+
+GEOMETRIES = {}     #order -> Geometry
+
+def geometry(order = 3):
+    if order not in GEOMETRIES:
+        if order not in ORDERS:
+            raise ValueError(f"unsupported board order {order!r}, expected one of {ORDERS}")
+        GEOMETRIES[order] = Geometry(order)
+    return GEOMETRIES[order]
+
+def order_of(cells):        #board order of a puzzle with this many cells
+    for order in ORDERS:
+        if order ** 4 == cells:
+            return order
+    raise ValueError(f"a puzzle has {' , '.join(str(order ** 4) for order in ORDERS)} cells, not {cells}")
+
+# The classic 9x9 board, whose tables are also available under their old module level names
+GEOMETRY = geometry(3)
+ALL_VALUES = GEOMETRY.all_values
+BIT = GEOMETRY.bit
+POPCOUNT = GEOMETRY.popcount
+LOWEST_VALUE = GEOMETRY.lowest_value
+MASK_VALUES = GEOMETRY.mask_values
+BOX_OF = GEOMETRY.box_of
+CELLS = GEOMETRY.cells
+COORDS = GEOMETRY.coords
+CELL_NAMES = GEOMETRY.cell_names
+ROWS , COLS , BOXES , UNITS = GEOMETRY.rows , GEOMETRY.cols , GEOMETRY.boxes , GEOMETRY.units
+UNITS_OF = GEOMETRY.units_of
+PEERS = GEOMETRY.peers
+ARCS = GEOMETRY.arcs
+ARCS_INTO = GEOMETRY.arcs_into
+
+ENGINES = ('ac3', 'brute', 'dlx')       #search engines selectable in SudokuCSP.solve
+
+# Phases a profiler (see profiler.py) times, as (phase, SudokuCSP method) pairs
+PROFILED_PHASES = (
+    ('validation', 'is_valid_grid'),
+    ('initial_ac3', 'initial_ac3'),
+    ('mrv', 'get_most_constrained_var'),
+    ('lcv', 'order_least_restricting_val'),
+    ('validation', 'is_valid_assignment'),
+    ('forward_checking', 'forward_checking'),
+    ('propagation', 'propagate'),
+)
+DEFAULT_RULES = ('hidden_singles', 'naked_pairs', 'hidden_pairs', 'pointing_pairs')     #inference rules, see inference.py
+
+# Logging levels, each one includes everything logged by the levels before it:
+#   'off'        nothing at all, for batch and service use
+#   'summary'    error messages and the statistics printed at the end of solve()
+#   'decisions'  one trace record per search assignment / undo, singleton, forward-checking removal, rule deduction
+#   'arcs'       additionally one record per arc revision and pruned value
+# logging=True means 'arcs' and logging=False means 'summary', as before the levels existed.
+# Trace records are compact lines '<kind> <field> ...' written to sys.stdout:
+#   assign r4c5 7 | undo r4c5 7 | single r4c5 7 | fc r4c6 7 | fail r4c6 r4c5 | rule <name> r4c6 13
+#   revise r4c6 r4c5 137 7 | prune r4c6 7 13
+LOG_LEVELS = ('off', 'summary', 'decisions', 'arcs')
+LOG_OFF, LOG_SUMMARY, LOG_DECISIONS, LOG_ARCS = range(4)
+
+def mask_to_str(mask):      #domain mask in the old '123456789' form (symbols from SYMBOLS), used for logging
+    return ''.join(SYMBOLS[v] for v in range(1 , mask.bit_length() + 1) if mask >> (v - 1) & 1)
+
+class SearchCancelled(Exception):       #raised inside the search once SudokuCSP.cancel() was called
+    pass
+
+class BudgetExceeded(SearchCancelled):     #raised inside the search when a limit given to solve() runs out
+    def __init__(self , reason , limit):
+        super().__init__(f'{reason} budget of {limit} exceeded')
+        self.reason = reason        #'timeout', 'nodes' or 'depth'
+        self.limit = limit
+
+class SolveResult:
+    # What solve() returns: the solution string (None unless solved), the success flag, a copy of the stats, the
+    # error ('invalid board', 'unsolvable', 'cancelled', 'budget exceeded: ...' or None), the seconds spent and,
+    # with a profiler attached, its per-phase report. Truthy exactly when solved, so `if csp.solve():` still works
+    def __init__(self , solution , success , stats , error = None , elapsed = 0.0 , profile = None):
+        self.solution = solution
+        self.success = success
+        self.stats = stats
+        self.error = error
+        self.elapsed = elapsed
+        self.profile = profile
+
+    def __bool__(self):
+        return self.success
+
+    def __repr__(self):
+        return f'{type(self).__name__}(success={self.success}, error={self.error!r}, nodes={self.stats.get("nodes")}, elapsed={self.elapsed:.4f})'
+
+class BudgetExceededResult(SolveResult):
+    # The failed SolveResult of a solve whose budget ran out. It also records which limit was hit and the board
+    # as far as the search had filled it
+    def __init__(self , reason , limit , stats , elapsed , grid , profile = None):
+        super().__init__(None , False , stats , f'budget exceeded: {reason}' , elapsed , profile)
+        self.reason = reason
+        self.limit = limit
+        self.grid = grid
+
+def log_level(logging):      #True / False, a name from LOG_LEVELS or its index -> level index
+    if logging is True or logging is False:
+        return LOG_ARCS if logging else LOG_SUMMARY
+    if isinstance(logging , str):
+        if logging not in LOG_LEVELS:
+            raise ValueError(f"unknown logging level {logging!r}, expected one of {LOG_LEVELS}")
+        return LOG_LEVELS.index(logging)
+    if logging not in range(len(LOG_LEVELS)):
+        raise ValueError(f"unknown logging level {logging!r}, expected one of {LOG_LEVELS}")
+    return logging
+
+def trace(kind , *fields):      #write one trace record, the fields are only formatted here
+    sys.stdout.write(kind + ' ' + ' '.join(map(str , fields)) + '\n')
+
+def parse_puzzle(text , order = None):
+    # order ** 4 symbols (81 for 9x9, 256 for 16x16, ...) with '0' or '.' for blanks -> the '0'-padded string
+    # SudokuCSP takes. Without an order any supported board size is accepted
+    puzzle = text.strip().replace('.', '0').upper()
+    sizes = [n ** 4 for n in (ORDERS if order is None else (order ,))]
+    if len(puzzle) not in sizes:
+        raise ValueError(f"expected {' or '.join(map(str , sizes))} symbols ('0' or '.' for blanks), got {len(puzzle)} characters: {puzzle[:20]!r}")
+    symbols = SYMBOLS[:order_of(len(puzzle)) ** 2 + 1]
+    if not set(puzzle) <= set(symbols):
+        raise ValueError(f"unexpected symbols {''.join(sorted(set(puzzle) - set(symbols)))!r}, expected {symbols!r}: {puzzle[:20]!r}")
+    return puzzle
+
 class SudokuCSP:
-    def __init__(self, initial_grid = None , logging = True):
-        self.grid = initial_grid if initial_grid else ''.join('0' for _ in range(9*9))
-        self.variables = [(row, col) for row in range(9) for col in range(9)]
-        self.domains = {var: '123456789' for var in self.variables}
+    def __init__(self, initial_grid = None , logging = 'summary' , ac_mode = 'cell' , rules = DEFAULT_RULES , profiler = None , order = None):
+        if order is None:       #follows from the puzzle, 9x9 without one
+            order = order_of(len(initial_grid)) if initial_grid else 3
+        self.geo = geo = geometry(order)        #tables of this board size, see Geometry
+        self.grid = initial_grid if initial_grid else '0' * geo.size    #stored in self.board
+        if len(self.board) != geo.size:
+            raise ValueError(f'a board of order {order} has {geo.size} cells, got {len(self.board)}')
+        self.variables = geo.cells
+        self.domains = [geo.all_values] * geo.size      #domain mask of every cell, indexed by row * side + col
+        self.row_used = [0] * geo.side          #values already placed in each row / column / box
+        self.col_used = [0] * geo.side
+        self.box_used = [0] * geo.side
         self.arcs = self.create_arcs()
         self.initialize_domains()
-        self.logging = logging
+        self.log_level = log_level(logging)     #index into LOG_LEVELS
+        self.tracing = self.log_level >= LOG_DECISIONS     #checked once per decision, never per arc
+        if self.log_level >= LOG_ARCS:
+            self.revise = self.traced_revise    #the untraced revise carries no logging code at all
+        self.ac_mode = ac_mode                  #'arc' for classic AC-3 over arcs, 'cell' for the cell/value worklist
+        self.arc_queued = bytearray(geo.size * geo.size)    #in-queue bitmaps (arc Xi * size + Xj / cell), all zero between calls
+        self.cell_queued = bytearray(geo.size)
+        self.trail = []                         #undo log of domain changes as (cell, old_mask)
+        self.placed = []                        #cells assigned during search, in order, so they can be cleared on undo
+        self.buckets = None                     #MRV buckets while a search runs, see build_buckets
+        self.free_peers = [0] * geo.size
+        self.rules = self.load_rules(rules)     #inference rules run after every propagation, () turns them off
+        self.cancelled = False                  #set by cancel() from another thread
+        self.checking = False                   #True while cancelled or a budget is set, the only test paid per node
+        self.timeout = self.max_nodes = self.max_depth = self.deadline = None     #budgets of the running solve()
+        self.depth = 0                          #current search depth, read by progress()
+        self.links = None                       #DancingLinks of a running dlx search
         self.stats = {
             'revised': 0,
             'pruned': 0,
             'singleton': 0,
-            'backtracks': 0
+            'backtracks': 0,
+            'nodes': 0,
+            'rules': {rule.__name__: 0 for rule in self.rules}
         }
+        self.profiler = profiler                #hook with wrap(phase, method), e.g. profiler.Profiler
+        if profiler is not None:
+            for phase , name in PROFILED_PHASES:
+                setattr(self , name , profiler.wrap(phase , getattr(self , name)))
+
+    def load_rules(self , rules):       #rule names from inference.RULES, or rule functions
+        from inference import RULES
+        return [RULES[rule] if isinstance(rule , str) else rule for rule in rules]
+
+    @property
+    def order(self):        #box side of the board, 3 for 9x9
+        return self.geo.order
 
-    def create_arcs(self):  #Function that create all possible arcs of the sudoko grid
-        arcs = []
-        for r in range(9):
-            for c in range(9):
-                for k in range(9):
-                    if k != c:
-                        arcs.append(((r , c) , (r , k)))  # Same row
-                        arcs.append(((r , k) , (r , c)))
-                    if k != r:
-                        arcs.append(((r , c) , (k , c)))  # Same column
-                        arcs.append(((r , k) , (r , c)))
-
-                # Same subgrid
-                br, bc = 3 * (r // 3), 3 * (c // 3)
-                for dr in range(3):
-                    for dc in range(3):
-                        nr, nc = br + dr, bc + dc
-                        if (nr, nc) != (r, c):
-                            arcs.append(((r , c) , (nr , nc)))
-                            arcs.append(((nr , nc) , (r , c)))
-        arcs = [(a, b) for (a, b) in arcs if a != b]
-        return arcs
+    def create_arcs(self):  #All arcs of the sudoku grid, shared by every instance of the board size
+        return self.geo.arcs
+
+    @property
+    def grid(self):     #the board as a string of one symbol per cell, only built when asked for
+        return self.board.translate(TO_CHARS).decode()
+
+    @grid.setter
+    def grid(self , puzzle_str):
+        self.board = bytearray(puzzle_str.encode().translate(FROM_CHARS))      #cell values 0..side, written in place
 
     def get_grid_val(self , row , col):
-        index = row * 9 + col
-        return int(self.grid[index])
+        return self.board[row * self.geo.side + col]
 
     def set_grid_val(self , row , col , value):
-        index = row * 9 + col
-        self.grid = self.grid[:index] + str(value) + self.grid[index + 1:]
+        self.board[row * self.geo.side + col] = value
+
+    def set_domain(self , cell , mask):     #change a domain and record the old mask on the trail
+        old = self.domains[cell]
+        self.trail.append((cell , old))
+        self.domains[cell] = mask
+        buckets = self.buckets
+        if buckets is not None and not self.board[cell]:
+            popcount = self.geo.popcount
+            if popcount[old] != popcount[mask]:
+                buckets[popcount[old]].remove(cell)
+                buckets[popcount[mask]].add(cell)
+
+    def build_buckets(self):
+        # MRV priority structure, built when search starts: buckets[size] is the set of unassigned cells whose
+        # domain has size values, free_peers[cell] the number of unassigned peers of an unassigned cell.
+        # set_domain, revise, place and undo keep both up to date until search() drops them again. Cells assigned
+        # before the build are not cleared during the search, so their free_peers entries are never read
+        board , domains , free_peers , geo = self.board , self.domains , self.free_peers , self.geo
+        self.buckets = buckets = [set() for _ in range(geo.side + 1)]
+        for cell in geo.cells:
+            if not board[cell]:
+                buckets[geo.popcount[domains[cell]]].add(cell)
+                free_peers[cell] = sum(1 for peer in geo.peers[cell] if not board[peer])
+
+    def place(self , cell , value):     #assign a cell during search so that undo can clear it again
+        self.board[cell] = value
+        self.placed.append(cell)
+        buckets = self.buckets
+        if buckets is not None:
+            buckets[self.geo.popcount[self.domains[cell]]].remove(cell)
+            free_peers = self.free_peers
+            for peer in self.geo.peers[cell]:
+                free_peers[peer] -= 1
+
+    def mark(self):     #position to return to with undo
+        return len(self.trail) , len(self.placed)
+
+    def undo(self , mark):      #unwind every domain change and assignment made after mark
+        trail_mark , placed_mark = mark
+        trail , domains , board = self.trail , self.domains , self.board
+        placed , buckets = self.placed , self.buckets
+        if buckets is None:
+            while len(trail) > trail_mark:
+                cell , mask = trail.pop()
+                domains[cell] = mask
+            while len(placed) > placed_mark:
+                board[placed.pop()] = 0
+            return
+        popcount , peers = self.geo.popcount , self.geo.peers
+        while len(trail) > trail_mark:
+            cell , mask = trail.pop()
+            if not board[cell]:
+                old , new = popcount[domains[cell]] , popcount[mask]
+                if old != new:
+                    buckets[old].remove(cell)
+                    buckets[new].add(cell)
+            domains[cell] = mask
+        free_peers = self.free_peers
+        while len(placed) > placed_mark:
+            cell = placed.pop()
+            board[cell] = 0
+            buckets[popcount[domains[cell]]].add(cell)
+            for peer in peers[cell]:
+                free_peers[peer] += 1
 
     def initialize_domains(self):   #for non-empty cells , assign values of cells as they are the singleton domains
-        for var in self.variables:
-                row , col = var
-                value = self.get_grid_val(row , col)
-                if value != 0:
-                    self.domains[var] = str(value)
+        geo = self.geo
+        for cell in self.variables:
+                value = self.board[cell]
+                if value != 0 and value <= geo.side:        #is_valid_grid rejects out of range values
+                    bit = geo.bit[value]
+                    row , col = geo.coords[cell]
+                    self.domains[cell] = bit
+                    self.row_used[row] |= bit
+                    self.col_used[col] |= bit
+                    self.box_used[geo.box_of[cell]] |= bit
 
     def is_assignment_complete(self):   #check that there is no empty cells
-        return all(self.get_grid_val(r , c) != 0 for r in range(9) for c in range(9))
+        return 0 not in self.board
 
     def is_valid_assignment(self, row, col):
-        # Check if the current row is valid
-        value = self.get_grid_val(row, col)
-        for c in range(9):
-            if c != col and self.get_grid_val(row, c) == value:
-                return False
-
-        # Check if the current column is valid
-        for r in range(9):
-            if r != row and self.get_grid_val(r, col) == value:
+        # Check that no cell in the same row, column or box holds the same value
+        cell = row * self.geo.side + col
+        board = self.board
+        value = board[cell]
+        for peer in self.geo.peers[cell]:
+            if board[peer] == value:
                 return False
-
-        # Check if the current 3x3 subgrid is valid
-        br, bc = 3 * (row // 3), 3 * (col // 3)
-        for dr in range(3):
-            for dc in range(3):
-                nr, nc = br + dr, bc + dc
-                if (nr, nc) != (row, col) and self.get_grid_val(nr, nc) == value:
-                    return False
         return True
 
     def backtrack_brute(self):        #Brute force algorithm no heuristic or Arc Consistency used
-        for r in range(9):
-            for c in range(9):
-                if self.get_grid_val(r , c) == 0:
-                    for val in range(1, 10):
-                        self.set_grid_val(r , c , val)
-                        if self.is_valid_assignment(r, c):
-                            if self.backtrack_brute():
-                                return True
-                            self.set_grid_val(r , c , 0)
+        self.stats['nodes'] += 1
+        if self.checking:
+            self.check_budget(self.stats['nodes'] , self.depth)
+        try:
+            cell = self.board.index(0)      #first empty cell
+        except ValueError:
+            return True
+        geo = self.geo
+        r , c = geo.coords[cell]
+        b = geo.box_of[cell]
+        used = self.row_used[r] | self.col_used[c] | self.box_used[b]
+        for val in geo.mask_values[geo.all_values & ~used]:     #only values not used in row, column or box
+            bit = geo.bit[val]
+            self.board[cell] = val
+            self.row_used[r] |= bit
+            self.col_used[c] |= bit
+            self.box_used[b] |= bit
+            self.depth += 1
+            if self.backtrack_brute():
+                return True
+            self.depth -= 1
+            self.row_used[r] &= ~bit
+            self.col_used[c] &= ~bit
+            self.box_used[b] &= ~bit
+            self.board[cell] = 0
+        return False
+        
+    def propagate(self , changed = None):      #restore consistency after `changed` was assigned (None = whole board)
+        if changed is None:
+            consistent = self.consistency()
+        else:
+            # cells that forward checking reduced to one value are propagated together with the assigned cell
+            popcount = self.geo.popcount
+            singles = [n for n in self.geo.peers[changed] if self.board[n] == 0 and popcount[self.domains[n]] == 1]
+            consistent = self.consistency([changed] + singles)
+        if not consistent:
+            return False
+        return self.apply_rules() if self.rules else True
+
+    def consistency(self , cells = None):      #AC-3 engine picked by ac_mode, from the given singleton cells
+        if self.ac_mode == 'arc':
+            arcs_into = self.geo.arcs_into
+            return self.arc_consistency(queue = [arc for cell in cells for arc in arcs_into[cell]] if cells is not None else None)
+        return self.cell_consistency(cells)
+
+    def apply_rules(self):      #run the inference rules to a fixpoint, propagating every cell they reduce to one value
+        domains , board , popcount = self.domains , self.board , self.geo.popcount
+        k = 0
+        while k < len(self.rules):
+            changed = self.rules[k](self)
+            if changed is None:
+                return False
+            if not changed:
+                k += 1      #nothing found, try the next (more expensive) rule
+                continue
+            singles = []
+            for cell in changed:
+                if domains[cell] == 0:
                     return False
+                if popcount[domains[cell]] == 1 and board[cell] == 0:
+                    singles.append(cell)
+            if singles and not self.consistency(singles):
+                return False
+            k = 0       #start over with the cheapest rule
         return True
-        
+
     def arc_consistency(self , queue = None):      #check arc consistency of all our arcs
         if not queue:
-            queue = self.arcs.copy()
+            queue = self.arcs
+
+        geo = self.geo
+        size = geo.size
+        queued = self.arc_queued        #each arc waits in the queue at most once
+        for Xi, Xj in queue:
+            queued[Xi * size + Xj] = 1
+        queue = deque(queue)
 
         while queue:
-            Xi, Xj = queue.pop(0)
-            dom_copy = self.domains[Xi]
+            Xi, Xj = queue.popleft()
+            queued[Xi * size + Xj] = 0
 
             pruned_now = self.revise(Xi, Xj)
 
-            if len(self.domains[Xi]) == 0:
-                if self.logging:
-                    print(f"Failure: Domain of {Xi} emptied by revising with {Xj}")
-                self.domains[Xi] = dom_copy
+            domain = self.domains[Xi]
+            if domain == 0:
+                if self.tracing:
+                    trace('fail' , geo.cell_names[Xi] , geo.cell_names[Xj])
+                for Xk, Xl in queue:
+                    queued[Xk * size + Xl] = 0
                 return False
 
-            if len(self.domains[Xi]) == 1:
-                value = next(iter(self.domains[Xi]))
-                i, j =  Xi
-                self.set_grid_val(i , j , value)
+            if geo.popcount[domain] == 1 and self.board[Xi] == 0:
+                value = geo.lowest_value[domain]
+                self.place(Xi , value)
                 self.stats['singleton'] += 1
-                if self.logging:
-                    print(f"Variable {Xi} became singleton with value {value}")
+                pruned_now = True       # singleton may come from forward checking, its neighbours must still see it
+                if self.tracing:
+                    trace('single' , geo.cell_names[Xi] , value)
 
             if pruned_now:
-                for Xk in self.get_neighbors(Xi):
-                    if Xk != Xj:
+                for Xk, _ in geo.arcs_into[Xi]:
+                    if Xk != Xj and not queued[Xk * size + Xi]:
+                        queued[Xk * size + Xi] = 1
                         queue.append((Xk, Xi))
 
         return True        
 
+    def cell_consistency(self , cells = None):     #AC-3 variant whose worklist holds cells instead of arcs
+        # With the != constraint every value of a peer keeps its residual support in Xj (any other value of Xj)
+        # until Xj is down to a single value, so only singleton cells are propagated and only peers that
+        # still hold that value are revised
+        geo = self.geo
+        popcount , peers = geo.popcount , geo.peers
+        queue = deque(geo.cells if cells is None else cells)
+        queued = self.cell_queued
+        for Xj in queue:
+            queued[Xj] = 1
+
+        while queue:
+            Xj = queue.popleft()
+            queued[Xj] = 0
+            domain_j = self.domains[Xj]
+            if popcount[domain_j] != 1:
+                continue
+
+            if self.board[Xj] == 0:
+                self.place(Xj , geo.lowest_value[domain_j])
+                self.stats['singleton'] += 1
+                if self.tracing:
+                    trace('single' , geo.cell_names[Xj] , geo.lowest_value[domain_j])
+
+            for Xi in peers[Xj]:
+                if not self.domains[Xi] & domain_j:     #residual support still valid, nothing to revise
+                    continue
+                self.revise(Xi, Xj)
+
+                domain = self.domains[Xi]
+                if domain == 0:
+                    if self.tracing:
+                        trace('fail' , geo.cell_names[Xi] , geo.cell_names[Xj])
+                    for Xk in queue:
+                        queued[Xk] = 0
+                    return False
+
+                if popcount[domain] == 1 and not queued[Xi]:
+                    queued[Xi] = 1
+                    queue.append(Xi)
+
+        return True
+
     def revise(self, Xi, Xj):   #apply arc consistency of an arc
         domain_i = self.domains[Xi]
         domain_j = self.domains[Xj]
 
-        prune_occured = False
-
         self.stats['revised'] += 1
-        if self.logging:
-            print(f"\nRevising arc {Xi} -> {Xj}")
-            print(f"Current domain of {Xi}: {domain_i}")
-            print(f"Domain of {Xj}: {domain_j}")
-
-        to_remove = []
-        for x in domain_i:
-            if not any(x != y for y in domain_j):
-                to_remove.append(x)
-
-        for x in to_remove:
-            if self.logging:
-                print(f"Removed {x} from {Xi} due to lack of support in {Xj}")
-            self.stats['pruned'] += 1
-            prune_occured = True
-            self.domains[Xi] = self.domains[Xi].replace(str(x) , "")
-
-        if(to_remove and self.logging):
-            print(f"Updated domain of {Xi}: {self.domains[Xi]}")
-
-        return prune_occured
-
-    def get_neighbors(self, var):       #get all neighbor variables of a variable
-        r, c = var
-        neighbors = set()
-        for k in range(9):
-            if k != c:
-                neighbors.add((r, k))
-            if k != r:
-                neighbors.add((k, c))
-        br, bc = 3 * (r // 3), 3 * (c // 3)
-        for dr in range(3):
-            for dc in range(3):
-                nr, nc = br + dr, bc + dc
-                if (nr, nc) != (r, c):
-                    neighbors.add((nr, nc))
-        return neighbors
+        # a value x of Xi only lacks support (some y != x) in Xj when Xj's domain is exactly {x}
+        # (domain_j & (domain_j - 1) clears the lowest bit, so it is 0 for a single value at any board size)
+        if domain_j & (domain_j - 1) or not domain_i & domain_j:
+            return False
+
+        self.trail.append((Xi , domain_i))
+        self.domains[Xi] = domain_i & ~domain_j
+        buckets = self.buckets
+        if buckets is not None and not self.board[Xi]:      #a singleton Xj takes exactly one value away
+            size = self.geo.popcount[domain_i]
+            buckets[size].remove(Xi)
+            buckets[size - 1].add(Xi)
+        self.stats['pruned'] += 1
+        return True
+
+    def traced_revise(self, Xi, Xj):    #revise that writes 'revise' and 'prune' records, used at the 'arcs' level
+        names = self.geo.cell_names
+        trace('revise' , names[Xi] , names[Xj] , mask_to_str(self.domains[Xi]) , mask_to_str(self.domains[Xj]))
+        pruned = SudokuCSP.revise(self , Xi , Xj)
+        if pruned:
+            trace('prune' , names[Xi] , self.geo.lowest_value[self.domains[Xj]] , mask_to_str(self.domains[Xi]))
+        return pruned
+
+    def get_neighbors(self, cell):       #get all neighbor variables of a variable
+        return self.geo.peers[cell]
     
     def get_first_unassigned(self):
-        for var in self.variables:
-            row , col = var        
-            if self.get_grid_val(row , col) == 0:
-                return var
+        for cell in self.variables:
+            if self.board[cell] == 0:
+                return cell
         return None
 
     def forward_checking(self , var , value):
                 
-        saved_domains = {}
         conflicts = []
+        bit = self.geo.bit[int(value)]
         
-        for neighbor in self.get_neighbors(var):
-            ni, nj = neighbor
-            if self.get_grid_val(ni , nj) == 0:
-                if value in self.domains[neighbor]:
-                    if neighbor not in saved_domains:
-                        saved_domains[neighbor] = self.domains[neighbor]
-                    
-                    self.domains[neighbor].replace(str(value) , '')
+        for n in self.geo.peers[var]:
+            if self.board[n] == 0:
+                if self.domains[n] & bit:
+                    self.set_domain(n , self.domains[n] & ~bit)
 
-                    if self.logging:
-                        print(f"Forward checking: removed {value} from domain of {neighbor}")
+                    if self.tracing:
+                        trace('fc' , self.geo.cell_names[n] , value)
                     
-                    if not self.domains[neighbor]:
-                        if self.logging:
-                            print(f"Forward checking: domain of {neighbor} became empty")
-                        conflicts.append(neighbor)
+                    if not self.domains[n]:
+                        conflicts.append(n)
         
         if conflicts:
-            for n, domain in saved_domains.items():
-                self.domains[n] = domain
-            return False
+            return False        #the caller undoes the removals through the trail
         
         return True
 
     def get_most_constrained_var(self):
-        unassigned = [var for var in self.variables if self.get_grid_val(*var) == 0]        #get all unassigned variables
-        return min(unassigned, key=lambda var: len(self.domains[var]), default=None)        #return variable with least number of possible domain values
+        # Smallest domain first, ties go to the cell with the most unassigned peers (degree heuristic). During a
+        # search the first non-empty bucket holds the candidates, no scan over the board
+        if self.buckets is None:
+            self.build_buckets()
+            try:
+                return self.get_most_constrained_var()
+            finally:
+                self.buckets = None
+        for bucket in self.buckets:
+            if bucket:
+                return max(bucket , key = self.free_peers.__getitem__) if len(bucket) > 1 else next(iter(bucket))
+        return None
     
-    def order_least_restricting_val(self , var):
-        neighbours_restricted = []
-        for value in self.domains[var]:
-            impact = 0
-            for neighbour in self.get_neighbors(var):
-                if value in self.domains[neighbour]:
-                    impact += 1
-            neighbours_restricted.append((value , impact))
+    def order_least_restricting_val(self , var):       #values of var, the one fewest peers still allow first
+        geo = self.geo
+        counts = geo.value_counts(self.domains , geo.peers[var])    #every value's peer count in one pass, no loop per value
+        shift , field_mask = geo.field_shift , geo.field_mask
+        return sorted(geo.mask_values[self.domains[var]] , key = lambda value: counts >> shift[value] & field_mask)
+
+    def backtrack_dlx(self):      #Algorithm X with Dancing Links over the exact cover matrix, see dlx.py
+        from dlx import DancingLinks
+        links = DancingLinks(self.board , self.order)
+        nodes = self.stats['nodes']
+        links.check = lambda links_nodes , depth: self.check_budget(nodes + links_nodes , depth)
+        self.links = links
+        links.checking = self.checking      #cancel() may have run before self.links was set
+        if self.cancelled:      #or between the read and the write above
+            links.checking = True
+        try:
+            solution = links.solve()
+        finally:
+            self.links = None
+            self.stats['nodes'] += links.stats['nodes']
+            self.stats['backtracks'] += links.stats['backtracks']
+        if solution is None:
+            return False
+        self.fill_board(solution)
+        return True
 
-        return [val for val, _ in sorted(neighbours_restricted, key=lambda x: x[1])]
+    def fill_board(self , values):      #write a full solution (values 1..side) onto the board and domains
+        bit = self.geo.bit
+        for cell , value in enumerate(values):
+            self.board[cell] = value
+            self.domains[cell] = bit[value]
 
-    def backtrack_ac3(self):
+    def search_solutions(self):     #backtracking search that yields the grid at every solution it reaches
+        self.stats['nodes'] += 1
+        if self.checking:
+            self.check_budget(self.stats['nodes'] , self.depth)
         unassigned = self.get_most_constrained_var()        #MCV heuristic
 
-        if not unassigned:
-            return True     # game complete (all variables assigned)
+        if unassigned is None:
+            yield self.grid     # game complete (all variables assigned)
+            return
         
-        row , col = unassigned
+        geo = self.geo
+        row , col = geo.coords[unassigned]
 
         for val in self.order_least_restricting_val(unassigned):        #LRV heuristic
             
-            original_grid = self.grid
-            old_domains = {v: self.domains[v] for v in self.variables}
+            mark = self.mark()      #only the changes made below are undone, no snapshot of the whole board
 
-            self.set_grid_val(row , col , int(val))
-            self.domains[unassigned] = str(val)
+            self.place(unassigned , val)
+            self.set_domain(unassigned , geo.bit[val])
 
-            if self.logging:
-                print(f'Backtrack assigned {val} to {unassigned}')
+            if self.tracing:
+                trace('assign' , geo.cell_names[unassigned] , val)
         
             if self.is_valid_assignment(row , col):
 
                 if self.forward_checking(unassigned , val):             #Forward Checking
-                    affected = [(neighbor, unassigned) for neighbor in self.get_neighbors(unassigned)]
-                    if self.arc_consistency(queue = affected):
+                    if self.propagate(unassigned):
 
-                        if self.backtrack_ac3():
-                            self.stats['backtracks'] += 1
-                            return True
+                        self.depth += 1
+                        yield from self.search_solutions()
+                        self.depth -= 1
                 
-            self.set_grid_val(row , col , 0)
-            self.domains = old_domains
-            self.grid = original_grid
+            self.undo(mark)
+            self.stats['backtracks'] += 1
+
+            if self.tracing:
+                trace('undo' , geo.cell_names[unassigned] , val)
 
-            if self.logging:
-                print(f'Backtrack reset {unassigned} from {val}')
+    def search(self):       #search_solutions with the MRV buckets built for it and dropped when it ends
+        self.build_buckets()
+        try:
+            yield from self.search_solutions()
+        finally:
+            self.buckets = None
 
+    def backtrack_ac3(self):
+        for _ in self.search():
+            return True     # stop at the first solution, it stays on the board
         return False
 
-    def solve(self):
+    def iter_solutions(self):       #lazily yield every solution as a grid string, the board is restored afterwards
         if not self.is_valid_grid():
-            print('\n\nERROR: Sudoku board is not valid')
-            return False
-        
-        self.arc_consistency()
-
-        if not self.backtrack_ac3():
-            print('\n\nERROR: Sudoku board is not solvable')
-            return False
+            return
+        mark = self.mark()
+        try:
+            if self.propagate():
+                yield from self.search()
+        finally:
+            self.undo(mark)     #also runs when the caller stops early
+
+    def count_solutions(self , limit = 2 , engine = 'ac3'):       #number of solutions, counting stops at limit
+        if engine == 'dlx':
+            from dlx import DancingLinks
+            return DancingLinks(self.board , self.order).count_solutions(limit = limit)
+
+        count = 0
+        for _ in self.iter_solutions():
+            count += 1
+            if limit is not None and count >= limit:
+                break
+        return count
+
+    def has_unique_solution(self , engine = 'ac3'):
+        return self.count_solutions(limit = 2 , engine = engine) == 1
+
+    def cancel(self):       #stop a solve running in another thread, solve() then returns False
+        self.cancelled = True
+        self.checking = True
+        links = self.links
+        if links is not None:
+            links.checking = True
+
+    def check_budget(self , nodes , depth):     #called once per search node while self.checking is set
+        if self.cancelled:
+            raise SearchCancelled('search cancelled')
+        if self.max_nodes is not None and nodes > self.max_nodes:
+            raise BudgetExceeded('nodes' , self.max_nodes)
+        if self.max_depth is not None and depth > self.max_depth:
+            raise BudgetExceeded('depth' , self.max_depth)
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise BudgetExceeded('timeout' , self.timeout)
+
+    def progress(self):     #(search nodes, current depth) of a running solve, safe to read from another thread
+        links = self.links
+        if links is not None:
+            return self.stats['nodes'] + links.stats['nodes'] , len(links.chosen)
+        return self.stats['nodes'] , self.depth
+
+    def initial_ac3(self):      #propagation over the whole board before search
+        return SudokuCSP.propagate(self)        #not self.propagate, so a profiler counts it here and not under propagation
+
+    def run_engine(self , engine):
+        if engine == 'ac3':
+            return self.initial_ac3() and self.backtrack_ac3()
+        if engine == 'brute':
+            return self.backtrack_brute()
+        if engine == 'dlx':
+            return self.backtrack_dlx()
+        raise ValueError(f"unknown engine {engine!r}, expected one of {ENGINES}")
+
+    def solve(self , engine = 'ac3' , timeout = None , max_nodes = None , max_depth = None , cache = None):
+        # timeout in seconds, max_nodes search nodes, max_depth search depth. They are checked once per search node,
+        # and when one runs out a (falsy) BudgetExceededResult is returned instead of the search going on.
+        # cache is a canonical.SolutionCache (9x9 boards only), asked before the search and given the solution after it.
+        # Returns a SolveResult
+        if cache is not None and self.order != 3:
+            raise ValueError('the solution cache only holds 9x9 boards')
+        self.started = time.perf_counter()
+        if not self.is_valid_grid():
+            if self.log_level >= LOG_SUMMARY:
+                print('\n\nERROR: Sudoku board is not valid')
+            return self.result(False , 'invalid board')
+
+        puzzle = self.grid
+        if cache is not None:
+            solution = cache.get(puzzle)
+            if solution is not None:
+                self.fill_board(solution.encode().translate(FROM_CHARS))
+                if self.log_level >= LOG_SUMMARY:
+                    print('\n\nSolved from the solution cache')
+                return self.result(True)
+
+
+        self.deadline = self.started + timeout if timeout is not None else None
+        self.timeout , self.max_nodes , self.max_depth = timeout , max_nodes , max_depth
+        budgets = timeout is not None or max_nodes is not None or max_depth is not None
+        self.checking = budgets or self.cancelled
+        if self.cancelled:      #cancel() sets cancelled before checking, so a cancel racing the line above is not lost
+            self.checking = True
+        try:
+            solved = self.run_engine(engine)
+        except BudgetExceeded as e:
+            if self.log_level >= LOG_SUMMARY:
+                print(f'\n\nSearch stopped: {e}')
+            return BudgetExceededResult(e.reason , e.limit , self.copy_stats() , time.perf_counter() - self.started ,
+                                        self.grid , self.profiler.report() if self.profiler else None)
+        except SearchCancelled:
+            if self.log_level >= LOG_SUMMARY:
+                print('\n\nSearch cancelled')
+            return self.result(False , 'cancelled')
+        finally:
+            self.checking = self.cancelled
+            self.timeout = self.max_nodes = self.max_depth = self.deadline = None
+
+        if not solved:
+            if self.log_level >= LOG_SUMMARY:
+                print('\n\nERROR: Sudoku board is not solvable')
+            return self.result(False , 'unsolvable')
+
+        if cache is not None:
+            cache.put(puzzle , self.grid)
         
+        if self.log_level < LOG_SUMMARY:
+            return self.result(True)
         print('\n')
         print('Number of Total Revisions that occured: ' + str(self.stats['revised']))
         print('Number of Pruned Domains: ' + str(self.stats['pruned']))
         print('Number of Singleton Assignments: ' + str(self.stats['singleton']))
         print('Number of Backtracks that occured: ' + str(self.stats['backtracks']))
+        print('Number of Search Nodes explored: ' + str(self.stats['nodes']))
+        for rule , count in self.stats['rules'].items():
+            print(f'Number of times {rule} fired: {count}')
+        if self.profiler is not None:
+            print(f'\n{self.profiler}')
+        return self.result(True)
+
+    def copy_stats(self):
+        return dict(self.stats , rules = dict(self.stats['rules']))
+
+    def result(self , success , error = None):
+        return SolveResult(self.grid if success else None , success , self.copy_stats() , error ,
+                           time.perf_counter() - self.started , self.profiler.report() if self.profiler else None)
 
     def print_sudoku(self):
         print('\n')
-        for i in range(9):
-            row = self.grid[i*9:(i+1)*9]
-            formatted = " ".join(row[j] if row[j] != '0' else '.' for j in range(9))
+        grid = self.grid
+        n , side = self.order , self.geo.side
+        for i in range(side):
+            row = grid[i*side:(i+1)*side]
+            formatted = " ".join(row[j] if row[j] != '0' else '.' for j in range(side))
             print(" ".join(
-                (f"| {c}" if j % 3 == 0 else c) for j, c in enumerate(formatted.split())
+                (f"| {c}" if j % n == 0 else c) for j, c in enumerate(formatted.split())
             ))
-            if i % 3 == 2 and i != 8:
-                print('-' * 23)
+            if i % n == n - 1 and i != side - 1:
+                print('-' * (2 * side + 2 * n - 1))
 
     def is_valid_grid(self):
-        # Check rows
-        for row in range(9):
-            seen = set()
-            for col in range(9):
-                val = self.get_grid_val(row , col)
-                if val != 0:  # Ignore empty cells
-                    if val in seen:
-                        return False  # Duplicate found in row
-                    seen.add(val)
-
-        # Check columns
-        for col in range(9):
-            seen = set()
-            for row in range(9):
-                val = self.get_grid_val(row , col)
-                if val != 0:  # Ignore empty cells
-                    if val in seen:
-                        return False  # Duplicate found in column
-                    seen.add(val)
-
-        # Check 3x3 subgrids
-        for box_row in range(0, 9, 3):
-            for box_col in range(0, 9, 3):
-                seen = set()
-                for row in range(box_row, box_row + 3):
-                    for col in range(box_col, box_col + 3):
-                        val = self.get_grid_val(row , col)
-                        if val != 0:  # Ignore empty cells
-                            if val in seen:
-                                return False  # Duplicate found in subgrid
-                            seen.add(val)
+        # One pass over the board, tracking the values seen in every row, column and box as masks
+        geo = self.geo
+        rows, cols, boxes = [0] * geo.side, [0] * geo.side, [0] * geo.side
+        for cell in geo.cells:
+            val = self.board[cell]
+            if val != 0:  # Ignore empty cells
+                if val > geo.side:
+                    return False  # Symbol outside this board's values
+                bit = geo.bit[val]
+                (r, c), b = geo.coords[cell], geo.box_of[cell]
+                if (rows[r] | cols[c] | boxes[b]) & bit:
+                    return False  # Duplicate found in row, column or subgrid
+                rows[r] |= bit
+                cols[c] |= bit
+                boxes[b] |= bit
 
         return True
 
@@ -328,4 +847,9 @@ if __name__ == "__main__":
     sudoku.print_sudoku()
     sudoku.solve()
     sudoku.print_sudoku()
-    print(f'\nIs it a valid board?: {sudoku.is_valid_grid()}')
\ No newline at end of file
+    print(f'\nIs it a valid board?: {sudoku.is_valid_grid()}')
+
+    import const
+    big = SudokuCSP(const.PUZZLE_16X16 , logging = 'off')
+    print(f'\n16x16: {big.solve()!r}')
+    big.print_sudoku()
\ No newline at end of file
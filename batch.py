@@ -0,0 +1,140 @@
+import os
+import time
+from collections import deque
+
+from backend import SudokuCSP, parse_puzzle
+
+# Bulk solving: puzzle strings are split into chunks and fanned out over a process pool.
+# Every puzzle gets one result dict, returned in input order:
+#   {'puzzle', 'solution' (None unless solved), 'solved', 'stats', 'time' (seconds), 'error' (None or message)}
+# limits is None or a dict of SudokuCSP.solve budgets ('timeout', 'max_nodes', 'max_depth') applied to every puzzle.
+# concurrent.futures is only imported once a pool is needed, so in-process use starts fast.
+# solve_store reads puzzles from a packed store (see store.py) and writes the solutions to another one.
+
+
+def solve_one(puzzle, engine='ac3', limits=None):
+    start = time.perf_counter()
+    try:
+        csp = SudokuCSP(parse_puzzle(puzzle), logging='off')      #no summary print, nobody would see it
+        result = csp.solve(engine, **(limits or {}))
+        return {
+            'puzzle': puzzle,
+            'solution': result.solution,
+            'solved': result.success,
+            'stats': result.stats,
+            'time': time.perf_counter() - start,
+            'error': result.error,
+        }
+    except Exception as e:      #a malformed puzzle must not take the rest of its chunk down
+        return failed_result(puzzle, f'{type(e).__name__}: {e}', time.perf_counter() - start)
+
+
+def failed_result(puzzle, error, elapsed=0.0):
+    return {'puzzle': puzzle, 'solution': None, 'solved': False, 'stats': {}, 'time': elapsed, 'error': error}
+
+
+def solve_chunk(puzzles, engine='ac3', limits=None):
+    return [solve_one(puzzle, engine, limits) for puzzle in puzzles]
+
+
+def make_pool(workers=None):
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def solve_isolated(puzzles, engine='ac3', limits=None):       #re-run a chunk lost to a crash, then puzzle by puzzle to find the one that kills the worker
+    from concurrent.futures.process import BrokenProcessPool
+    try:
+        with make_pool(1) as pool:
+            return pool.submit(solve_chunk, puzzles, engine, limits).result()
+    except BrokenProcessPool as e:
+        if len(puzzles) == 1:
+            return [failed_result(puzzles[0], f'worker crashed: {e}')]
+        return [result for puzzle in puzzles for result in solve_isolated([puzzle], engine, limits)]
+
+
+def solve_many(puzzles, workers=None, chunksize=64, engine='ac3', limits=None):
+    # All results as a list, in input order. workers=0 solves in this process, handy for debugging and profiling
+    return list(solve_stream(puzzles, workers, chunksize, engine=engine, limits=limits))
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def finished(future):       #done with a result, not lost to a crash
+    return future.done() and not future.cancelled() and future.exception() is None
+
+
+def solve_stream(puzzles, workers=0, chunksize=64, max_pending=None, engine='ac3', limits=None):
+    # Lazily solve an iterable of puzzles and yield results in input order. At most max_pending chunks are in
+    # flight, so memory stays bounded however long the input is, while reading and writing overlap with solving
+    if workers == 0:
+        for puzzle in puzzles:
+            yield solve_one(puzzle, engine, limits)
+        return
+
+    from concurrent.futures.process import BrokenProcessPool
+    max_pending = max_pending or 2 * (workers or os.cpu_count() or 1)
+    pool = make_pool(workers)
+    pending = deque()
+
+    def restart():      #replace a dead pool and resubmit what was lost with it, finished chunks keep their results
+        nonlocal pool, pending
+        pool.shutdown(wait=False)
+        pool = make_pool(workers)
+        pending = deque((f, c) if finished(f) else (pool.submit(solve_chunk, c, engine, limits), c) for f, c in pending)
+
+    try:
+        chunks = chunked(puzzles, chunksize)
+        while True:
+            while len(pending) < max_pending:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                try:
+                    future = pool.submit(solve_chunk, chunk, engine, limits)
+                except BrokenProcessPool:       #a worker died since the last result was collected
+                    restart()
+                    future = pool.submit(solve_chunk, chunk, engine, limits)
+                pending.append((future, chunk))
+            if not pending:
+                break
+
+            future, chunk = pending.popleft()
+            try:
+                results = future.result()
+            except BrokenProcessPool:       #the other chunks go on in parallel while this one is retried in isolation
+                restart()
+                results = solve_isolated(chunk, engine, limits)
+            yield from results
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def solve_store(path, output, workers=0, chunksize=64, max_pending=None, engine='ac3', limits=None):
+    # Solve every puzzle of the store at path and write puzzles and solutions to the store output, streaming both
+    # ways. Returns the number of puzzles solved and failed
+    from store import PuzzleStore, PuzzleWriter
+    solved = failed = 0
+    with PuzzleStore(path) as puzzles, PuzzleWriter(output, solutions=True) as writer:
+        for result in solve_stream(puzzles, workers, chunksize, max_pending, engine, limits):
+            writer.write(result['puzzle'], result['solution'])
+            solved += result['solved']
+            failed += not result['solved']
+    return solved, failed
+
+
+# Example usage
+if __name__ == "__main__":
+    import const
+    names = ['EASY_PUZZLE', 'MEDIUM_PUZZLE', 'HARD_PUZZLE', 'EXPERT_PUZZLE', 'EXTREME_PUZZLE', 'MASTER_PUZZLE']
+    for name, result in zip(names, solve_many([getattr(const, name) for name in names], chunksize=1)):
+        print(f"{name}: {result['solution']} in {result['time']:.4f} seconds")
@@ -0,0 +1,214 @@
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import const
+from backend import ENGINES, BudgetExceededResult, SudokuCSP, parse_puzzle
+
+# Headless benchmark: python -m benchmark [--engines ac3 dlx] [--output run.json] [--compare baseline.json]
+# Solves a fixed corpus with every engine and reports per engine and puzzle group the median / p95 latency,
+# nodes per second, peak memory and how many solves failed or ran out of their timeout. The corpus is the
+# const.py puzzles (group 'const') plus the seeded per-difficulty sets in benchmark_corpus.txt, which also holds
+# a set of 16x16 puzzles (group '16x16') for the engines that scale to them. The generator is timed as well.
+# Results are written as JSON, and comparing with an earlier run flags regressions.
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_corpus.txt')
+CORPUS_SEED = 2024
+CORPUS_PER_DIFFICULTY = 10
+CORPUS_LARGE = 6        #16x16 puzzles in group '16x16'
+LARGE_GROUPS = ('16x16',)
+SCALING_ENGINES = ('ac3', 'dlx')        #engines timed on the large groups, brute force runs out of time on most of them
+CONST_PUZZLES = ('EASY_PUZZLE', 'MEDIUM_PUZZLE', 'HARD_PUZZLE', 'EXPERT_PUZZLE', 'EXTREME_PUZZLE', 'MASTER_PUZZLE',
+                 'CUSTOM')
+LATENCY_METRICS = ('median', 'p95')         #compared between runs, higher is worse
+
+
+def load_corpus(path=CORPUS_FILE):     #{group: [puzzle, ...]}, the const.py puzzles first
+    corpus = {'const': [getattr(const, name) for name in CONST_PUZZLES]}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                group, puzzle = line.split()
+                corpus.setdefault(group, []).append(parse_puzzle(puzzle))
+    return corpus
+
+
+def make_corpus(path=CORPUS_FILE, per_difficulty=CORPUS_PER_DIFFICULTY, seed=CORPUS_SEED, large=CORPUS_LARGE):
+    from suduko_generator import generate_batch
+    with open(path, 'w') as f:
+        f.write(f'# Benchmark corpus: {per_difficulty} puzzles per difficulty and {large} 16x16 puzzles from '
+                f'generate_batch(seed={seed}), rebuild with python -m benchmark --make-corpus\n')
+        for difficulty in const.DIFFICULTIES:
+            for puzzle in generate_batch(per_difficulty, difficulty, workers=0, seed=seed):
+                f.write(f"{difficulty} {puzzle['puzzle']}\n")
+        for puzzle in generate_batch(large, workers=0, seed=seed, order=4):
+            f.write(f"16x16 {puzzle['puzzle']}\n")
+
+
+def percentile(values, q):      #nearest-rank percentile of a non-empty list
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def time_solve(puzzle, engine, timeout, repeat):
+    # Best of repeat runs: (seconds, nodes, outcome) with outcome 'solved', 'failed' or 'timeout'
+    best = None
+    for _ in range(repeat):
+        csp = SudokuCSP(puzzle, logging='off')
+        start = time.perf_counter()
+        result = csp.solve(engine, timeout=timeout)
+        elapsed = time.perf_counter() - start
+        outcome = 'solved' if result else ('timeout' if isinstance(result, BudgetExceededResult) else 'failed')
+        if best is None or elapsed < best[0]:
+            best = (elapsed, csp.stats['nodes'], outcome)
+        if outcome == 'timeout':        #no point in waiting for it again
+            break
+    return best
+
+
+def peak_memory(puzzles, engine, timeout):     #peak bytes allocated while solving puzzles one after another
+    tracemalloc.start()
+    try:
+        for puzzle in puzzles:
+            SudokuCSP(puzzle, logging='off').solve(engine, timeout=timeout)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def summarize(times, nodes, outcomes):
+    return {
+        'puzzles': len(times),
+        'median': statistics.median(times),
+        'p95': percentile(times, 95),
+        'total': sum(times),
+        'nodes_per_sec': sum(nodes) / sum(times) if sum(times) else 0.0,
+        'failed': outcomes.count('failed'),
+        'timeouts': outcomes.count('timeout'),
+    }
+
+
+def bench_engine(corpus, engine, timeout, repeat, memory=True):
+    if engine not in SCALING_ENGINES:
+        corpus = {group: puzzles for group, puzzles in corpus.items() if group not in LARGE_GROUPS}
+    groups = {}
+    all_times, all_nodes, all_outcomes = [], [], []
+    for group, puzzles in corpus.items():
+        runs = [time_solve(puzzle, engine, timeout, repeat) for puzzle in puzzles]
+        times, nodes, outcomes = (list(column) for column in zip(*runs))
+        groups[group] = summarize(times, nodes, outcomes)
+        all_times += times
+        all_nodes += nodes
+        all_outcomes += outcomes
+    result = {'overall': summarize(all_times, all_nodes, all_outcomes), 'groups': groups}
+    if memory:      #separate pass, tracing allocations slows the solver down too much to time it at the same time
+        result['overall']['peak_memory'] = peak_memory([p for ps in corpus.values() for p in ps], engine, timeout)
+    return result
+
+
+def bench_generator(count, seed=CORPUS_SEED):      #puzzles per second of seeded, rated generation in this process
+    from suduko_generator import generate_batch
+    start = time.perf_counter()
+    generate_batch(count, workers=0, seed=seed)
+    elapsed = time.perf_counter() - start
+    return {'puzzles': count, 'total': elapsed, 'puzzles_per_sec': count / elapsed}
+
+
+def run(engines=ENGINES, timeout=5.0, repeat=3, generator=20, memory=True, corpus=None):
+    corpus = corpus or load_corpus()
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'timeout': timeout,
+            'repeat': repeat,
+            'corpus': {group: len(puzzles) for group, puzzles in corpus.items()},
+        },
+        'engines': {engine: bench_engine(corpus, engine, timeout, repeat, memory) for engine in engines},
+    }
+    if generator:
+        results['generator'] = bench_generator(generator)
+    return results
+
+
+def compare(baseline, current, threshold=0.10):
+    # Regressions of current against baseline: latencies (per engine, overall and per group) that grew by more
+    # than threshold, and generator throughput that fell by more than it. Returns a list of messages
+    regressions = []
+    for engine, result in current['engines'].items():
+        old = baseline.get('engines', {}).get(engine)
+        if old is None:
+            continue
+        sections = [('overall', result['overall'], old['overall'])]
+        sections += [(group, stats, old['groups'][group]) for group, stats in result['groups'].items()
+                     if group in old['groups']]
+        for section, new_stats, old_stats in sections:
+            for metric in LATENCY_METRICS:
+                before, after = old_stats[metric], new_stats[metric]
+                if before > 0 and after > before * (1 + threshold):
+                    regressions.append(f'{engine} {section} {metric}: {before * 1000:.3f} ms -> '
+                                       f'{after * 1000:.3f} ms (+{(after / before - 1) * 100:.0f}%)')
+    old_gen, new_gen = baseline.get('generator'), current.get('generator')
+    if old_gen and new_gen and new_gen['puzzles_per_sec'] < old_gen['puzzles_per_sec'] * (1 - threshold):
+        regressions.append(f"generator: {old_gen['puzzles_per_sec']:.1f} -> {new_gen['puzzles_per_sec']:.1f} puzzles/s")
+    return regressions
+
+
+def print_report(results, out=sys.stdout):
+    for engine, result in results['engines'].items():
+        out.write(f'\n{engine}\n')
+        out.write(f"  {'group':<9}{'n':>4}{'median ms':>12}{'p95 ms':>10}{'nodes/s':>11}{'failed':>8}{'timeouts':>10}\n")
+        for group, stats in list(result['groups'].items()) + [('overall', result['overall'])]:
+            out.write(f"  {group:<9}{stats['puzzles']:>4}{stats['median'] * 1000:>12.3f}{stats['p95'] * 1000:>10.3f}"
+                      f"{stats['nodes_per_sec']:>11.0f}{stats['failed']:>8}{stats['timeouts']:>10}\n")
+        if 'peak_memory' in result['overall']:
+            out.write(f"  peak memory: {result['overall']['peak_memory'] / 1024:.1f} KiB\n")
+    if 'generator' in results:
+        gen = results['generator']
+        out.write(f"\ngenerator: {gen['puzzles']} puzzles in {gen['total']:.2f} s ({gen['puzzles_per_sec']:.1f}/s)\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmark', description='Benchmark the solver engines.')
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(ENGINES), help='engines to time')
+    parser.add_argument('--timeout', type=float, default=5.0, help='seconds a single solve may take (default: 5)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per puzzle, the fastest counts (default: 3)')
+    parser.add_argument('--generator', type=int, default=20, help='puzzles to generate for the generator timing, 0 skips it')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc peak memory pass')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.10, help='relative slowdown flagged as regression (default: 0.10)')
+    parser.add_argument('--make-corpus', action='store_true', help='regenerate benchmark_corpus.txt from its seed and exit')
+    args = parser.parse_args(argv)
+
+    if args.make_corpus:
+        make_corpus()
+        return 0
+
+    results = run(args.engines, args.timeout, args.repeat, args.generator, not args.no_memory)
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        for message in regressions:
+            print(f'REGRESSION {message}')
+        if regressions:
+            return 1
+        print(f'\nno regressions beyond {args.threshold:.0%}')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
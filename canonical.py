@@ -0,0 +1,305 @@
+import dbm
+from collections import OrderedDict
+from itertools import permutations, product
+from operator import itemgetter
+
+from backend import FROM_CHARS, TO_CHARS
+
+# Canonical form of a puzzle under the sudoku symmetries: transposition, band and stack permutations, row and
+# column permutations inside a band / stack, and relabeling of the digits. Every puzzle in one symmetry class gets
+# the same canonical string, the lexicographically smallest one in the class with digits relabeled 1, 2, 3, ... in
+# order of first appearance. A transform (transposed, rows, cols, labels) says how it was reached: canonical cell
+# (i, j) holds labels[g[rows[i]][cols[j]]], g being the puzzle, transposed first when transposed is True.
+
+TRIPLES = tuple(permutations(range(3)))
+INF = b'\xff' * 9       #compares greater than any row
+UNSEEN = 0xFE           #label table entry of a digit that has no label yet
+NO_LABELS = bytes([0] + [UNSEEN] * 255)
+BLANK_ROW = bytes(9)
+
+
+def transpose(values):      #81 values, rows and columns swapped
+    return bytes(values[c * 9 + r] for r in range(9) for c in range(9))
+
+
+def column_orders(row):
+    # Every column order that moves the row's blanks as far left as the stack structure allows. The first canonical
+    # row is such a row, as its digits always relabel to 1, 2, 3, ... whatever the order
+    blanks = [sum(1 for c in range(3 * s, 3 * s + 3) if not row[c]) for s in range(3)]
+    inner = [[order for order in permutations(range(3 * s, 3 * s + 3))
+              if all(row[a] or not row[b] for a, b in zip(order, order[1:]))]      #blanks before digits
+             for s in range(3)]
+    for stacks in TRIPLES:
+        if blanks[stacks[0]] >= blanks[stacks[1]] >= blanks[stacks[2]]:
+            for a, b, c in product(*(inner[s] for s in stacks)):
+                yield a + b + c
+
+
+def first_row_form(row):        #the row as it reads first in the canonical form
+    cols = next(column_orders(row))
+    return bytes(1 if row[c] else 0 for c in cols)      #digit values only matter as blank / not blank
+
+
+def canonicalize(puzzle_str):
+    # (canonical string, transform) for an 81-character puzzle with '0' blanks. Candidate first rows are narrowed
+    # by their blank pattern, then rows are placed depth first, cutting every branch whose prefix already compares
+    # greater than the best form found. Blank rows read the same under every column order, so the column order is
+    # only chosen (among the column_orders of the row) once the first row with digits is placed
+    values = puzzle_str.encode().translate(FROM_CHARS)
+    grids = (bytes(values), transpose(values))
+
+    starts = []
+    best_first = None
+    for t, g in enumerate(grids):
+        for r in range(9):
+            first = first_row_form(g[r * 9:r * 9 + 9])
+            if best_first is None or first < best_first:
+                best_first, starts = first, [(t, r)]
+            elif first == best_first:
+                starts.append((t, r))
+
+    best = [INF] * 9
+    found = None
+    grid_rows = first_rows = None       #rows of the grid (transposed or not) being searched, and its first row choices
+
+    def relabel(row, labels, label):        #row with digits relabeled, giving unseen digits the next labels
+        out = row.translate(labels)
+        if UNSEEN not in out:
+            return out, labels, label
+        labels = bytearray(labels)
+        for v in row:
+            if labels[v] == UNSEEN:
+                labels[v] = label
+                label += 1
+        return row.translate(labels), labels, label
+
+    def step(k, i, order, view, labels, label):     #put row i at position k, view = (cols, permute, permuted rows)
+        rows = view[2]
+        row = rows[i]
+        if row is None:     #rows are only permuted once a branch gets to them
+            row = rows[i] = bytes(view[1](grid_rows[i]))
+        out, labels, label = relabel(row, labels, label)
+        if out > best[k]:
+            return
+        if out < best[k]:       #a smaller prefix, everything below it has to be found again
+            best[k] = out
+            best[k + 1:] = [INF] * (8 - k)
+        place(k + 1, order + (i,), view, labels, label)
+
+    def place(k, order, view, labels, label):
+        nonlocal found
+        if k == 9:
+            found = (order, view[0] if view else tuple(range(9)), labels)
+            return
+        if k == 0:
+            choices = first_rows
+        elif k % 3:     #finish the band of the row before
+            band = order[-1] // 3
+            choices = [i for i in range(3 * band, 3 * band + 3) if i not in order]
+        else:
+            choices = [i for i in range(9) if all(i // 3 != o // 3 for o in order)]
+        for i in choices:
+            if view is not None:
+                step(k, i, order, view, labels, label)
+            elif grid_rows[i] == BLANK_ROW:         #every row so far is blank, no column order chosen yet
+                if BLANK_ROW <= best[k]:
+                    if BLANK_ROW < best[k]:         #a smaller prefix, as in step()
+                        best[k] = BLANK_ROW
+                        best[k + 1:] = [INF] * (8 - k)
+                    place(k + 1, order + (i,), None, labels, label)
+            else:
+                for cols in column_orders(grid_rows[i]):
+                    step(k, i, order, (cols, itemgetter(*cols), [None] * 9), labels, label)
+
+    transform = None
+    for t, g in enumerate(grids):
+        grid_rows = [g[i * 9:i * 9 + 9] for i in range(9)]
+        first_rows = [r for s, r in starts if s == t]
+        found = None
+        place(0, (), None, NO_LABELS, 1)
+        if found is not None:
+            transform = (bool(t),) + found
+
+    transposed, order, cols, labels = transform
+    labels = bytearray(labels[:10])
+    label = max(labels[d] for d in range(10) if labels[d] != UNSEEN) + 1
+    for d in range(1, 10):      #digits missing from the puzzle still need a label to map solutions back
+        if labels[d] == UNSEEN:
+            labels[d] = label
+            label += 1
+    return b''.join(best).translate(TO_CHARS).decode(), (transposed, order, cols, bytes(labels))
+
+
+def to_canonical(grid_str, transform):      #any grid of the puzzle (e.g. its solution) in the canonical frame
+    transposed, rows, cols, labels = transform
+    values = grid_str.encode().translate(FROM_CHARS)
+    if transposed:
+        values = transpose(values)
+    out = bytes(labels[values[r * 9 + c]] for r in rows for c in cols)
+    return out.translate(TO_CHARS).decode()
+
+
+def from_canonical(grid_str, transform):        #a canonical-frame grid (e.g. a cached solution) back in the puzzle's frame
+    transposed, rows, cols, labels = transform
+    inverse = bytearray(10)
+    for d, label in enumerate(labels):
+        inverse[label] = d
+    values = grid_str.encode().translate(FROM_CHARS)
+    out = bytearray(81)
+    for i, r in enumerate(rows):
+        for j, c in enumerate(cols):
+            out[r * 9 + c] = inverse[values[i * 9 + j]]
+    if transposed:
+        out = transpose(out)
+    return bytes(out).translate(TO_CHARS).decode()
+
+
+def keeps_givens(puzzle_str, solution):        #True when the solution has every clue of the puzzle in place
+    return all(given == '0' or given == value for given, value in zip(puzzle_str, solution))
+
+
+def class_key(puzzle_str):
+    # Cheap key that every puzzle of a symmetry class shares, 27 digits: the clue counts of the rows band by band and
+    # of the columns stack by stack, each sorted, the two swapped into order as transposition swaps them, then the
+    # sorted clue counts of the digits. Puzzles with different keys can never have the same canonical form
+    rows = [str(9 - puzzle_str.count('0', i, i + 9)) for i in range(0, 81, 9)]
+    cols = [str(9 - puzzle_str[c::9].count('0')) for c in range(9)]
+    bands = ''.join(sorted(''.join(sorted(rows[b:b + 3])) for b in (0, 3, 6)))
+    stacks = ''.join(sorted(''.join(sorted(cols[s:s + 3])) for s in (0, 3, 6)))
+    lines = bands + stacks if bands <= stacks else stacks + bands
+    return lines + ''.join(sorted(str(puzzle_str.count(d)) for d in '123456789'))
+
+
+class SolutionCache:
+    # LRU cache of solutions keyed by canonical form, so relabeled, transposed or permuted copies of a solved
+    # puzzle hit as well. An exact-string tier in front answers repeated puzzles without canonicalizing them.
+    # Canonicalizing takes milliseconds, more than solving most 9x9 puzzles, so it only happens when class_key()
+    # matches a puzzle already cached: put() keeps solutions of other puzzles raw, under their class key, and a
+    # later lookup with that key canonicalizes them together with the puzzle asked for. A lookup from a class never
+    # seen costs microseconds.
+    # With a path, solutions are also kept in a dbm file that outlives the process: canonical strings -> canonical
+    # solutions, CLASS_PREFIX + class key -> the number of raw records still to canonicalize for that class (the
+    # key stays, at 0, once the class is seen) and CLASS_PREFIX + class key + '/<k>' -> raw record k, puzzle and
+    # solution as one 162-character string. Every put() writes one record, whatever the size of its class.
+    CLASS_PREFIX = b'~'
+
+    def __init__(self, maxsize=4096, path=None):
+        self.maxsize = maxsize
+        self.exact = OrderedDict()          #puzzle string -> solution
+        self.canonical = OrderedDict()      #canonical string -> canonical solution
+        self.pending = OrderedDict()        #class key -> [(puzzle, solution), ...] not canonicalized yet
+        self.pending_count = 0
+        self.classes = {}       #class key -> canonical entries held for it
+        self.disk = dbm.open(path, 'c') if path else None
+        self.stats = {'exact': 0, 'canonical': 0, 'disk': 0, 'misses': 0, 'rejected': 0}
+        self.last = None        #(puzzle, canonical, transform) of the last miss, so put() need not canonicalize again
+
+    def remember(self, tier, key, value):       #returns the key evicted to make room, or None
+        tier[key] = value
+        tier.move_to_end(key)
+        if len(tier) > self.maxsize:
+            return tier.popitem(last=False)[0]
+        return None
+
+    def key(self, puzzle_str):
+        if self.last is not None and self.last[0] == puzzle_str:
+            return self.last[1], self.last[2]
+        canonical, transform = canonicalize(puzzle_str)
+        self.last = (puzzle_str, canonical, transform)
+        return canonical, transform
+
+    def seen(self, cls):        #whether any puzzle of class key cls is cached
+        return (cls in self.classes or cls in self.pending or
+                (self.disk is not None and self.CLASS_PREFIX + cls.encode() in self.disk))
+
+    def store(self, canonical, solved):     #a canonical entry, in memory and on disk
+        if canonical not in self.canonical:
+            cls = class_key(canonical)
+            self.classes[cls] = self.classes.get(cls, 0) + 1
+        evicted = self.remember(self.canonical, canonical, solved)
+        if evicted is not None:
+            cls = class_key(evicted)
+            self.classes[cls] -= 1
+            if not self.classes[cls]:
+                del self.classes[cls]
+        if self.disk is not None:
+            self.disk[canonical.encode()] = solved.encode()
+
+    def settle(self, cls):      #canonicalize the raw solutions held for class key cls
+        entries = self.pending.pop(cls, [])
+        self.pending_count -= len(entries)
+        if self.disk is not None:
+            disk_key = self.CLASS_PREFIX + cls.encode()
+            for k in range(int(self.disk[disk_key]) if disk_key in self.disk else 0):
+                record_key = disk_key + b'/%d' % k
+                raw = self.disk[record_key].decode()
+                entries.append((raw[:81], raw[81:]))
+                del self.disk[record_key]
+            self.disk[disk_key] = b'0'      #kept, it marks the class as seen
+        for puzzle, solution in entries:
+            canonical, transform = canonicalize(puzzle)
+            self.store(canonical, to_canonical(solution, transform))
+
+    def get(self, puzzle_str):      #solution string, or None on a miss
+        solution = self.exact.get(puzzle_str)
+        if solution is not None:
+            self.exact.move_to_end(puzzle_str)
+            self.stats['exact'] += 1
+            return solution
+
+        cls = class_key(puzzle_str)
+        if not self.seen(cls):      #no cached puzzle can share its canonical form
+            self.stats['misses'] += 1
+            return None
+        self.settle(cls)
+        canonical, transform = self.key(puzzle_str)
+        solved = self.canonical.get(canonical)
+        if solved is not None:
+            self.canonical.move_to_end(canonical)
+            self.stats['canonical'] += 1
+        elif self.disk is not None and canonical.encode() in self.disk:
+            solved = self.disk[canonical.encode()].decode()
+            self.store(canonical, solved)
+            self.stats['disk'] += 1
+        else:
+            self.stats['misses'] += 1
+            return None
+
+        solution = from_canonical(solved, transform)
+        if not keeps_givens(puzzle_str, solution):      #never hand out a solution that overwrites a clue
+            self.stats['rejected'] += 1
+            return None
+        self.remember(self.exact, puzzle_str, solution)
+        return solution
+
+    def put(self, puzzle_str, solution):
+        self.remember(self.exact, puzzle_str, solution)
+        if self.last is not None and self.last[0] == puzzle_str:       #get() canonicalized it already
+            _, canonical, transform = self.last
+            self.store(canonical, to_canonical(solution, transform))
+            return
+        cls = class_key(puzzle_str)
+        self.pending.setdefault(cls, []).append((puzzle_str, solution))
+        self.pending.move_to_end(cls)
+        self.pending_count += 1
+        while self.pending_count > self.maxsize:
+            self.pending_count -= len(self.pending.popitem(last=False)[1])
+        if self.disk is not None:
+            disk_key = self.CLASS_PREFIX + cls.encode()
+            count = int(self.disk[disk_key]) if disk_key in self.disk else 0
+            self.disk[disk_key + b'/%d' % count] = (puzzle_str + solution).encode()
+            self.disk[disk_key] = b'%d' % (count + 1)
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+            self.disk = None
+
+
+# Example usage
+if __name__ == "__main__":
+    import const
+    canonical, transform = canonicalize(const.EXPERT_PUZZLE)
+    print(f'{const.EXPERT_PUZZLE} -> {canonical}')
+    relabeled = const.EXPERT_PUZZLE.translate(str.maketrans('123456789', '987654321'))
+    print(f'relabeled copy: {canonicalize(transpose(relabeled.encode()).decode())[0]}')
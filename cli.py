@@ -0,0 +1,155 @@
+import argparse
+import json
+import sys
+
+from backend import ENGINES
+from batch import solve_stream
+from store import PuzzleStore, PuzzleWriter, is_store
+from validate import validate_batch
+
+# Headless solver: python -m cli [puzzles.txt] [--json] [--workers N] [--engine ac3|brute|dlx]
+#                                [--timeout SECONDS] [--max-nodes N] [--max-depth N]
+# Reads one puzzle per line (81 characters, 256 / 625 for 16x16 / 25x25 boards, '0' or '.' for blanks, blank lines
+# and '#' comments skipped) from a file or stdin and writes one line per puzzle: the solution, or 'ERROR: ...' when
+# it could not be solved. The input may also be a packed store (see store.py), --store writes the puzzles and their
+# solutions to a new store (9x9 puzzles only, other lines are still solved and printed but not stored).
+# --validate checks the puzzles instead of solving them and writes 'OK' or 'INVALID: <column> <problem>' per line.
+# Lines may carry a claimed solution after the puzzle ('puzzle solution', '-' for none, as python -m store unpack
+# --solutions writes them), which must then be a complete grid keeping the puzzle's givens. --complete asks for
+# complete grids in the puzzle column as well. Validation runs in blocks through validate.validate_batch (NumPy).
+# Only imports the solver, never tkinter or pygame, so it runs on servers without a display.
+
+
+VALIDATE_BLOCK = 65536      #input lines validated per validate_batch call
+
+
+def read_puzzles(stream):
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def format_result(result, as_json):
+    if as_json:
+        return json.dumps(result, separators=(',', ':'))
+    if result['solved']:
+        return result['solution']
+    return f"ERROR: {result['error']}"
+
+
+def validation_blocks(args, block=VALIDATE_BLOCK):
+    # (first index, puzzles, solutions, has_solution) blocks of the input, store columns as (n, 81) digit arrays
+    import numpy as np
+    if args.input != '-' and is_store(args.input):
+        with PuzzleStore(args.input) as store:
+            for start in range(0, len(store), block):
+                part = slice(start, start + block)
+                puzzles = store.digits(part)
+                if store.has_solutions:
+                    solutions = store.digits(part, 1)
+                    yield start, puzzles, solutions, solutions.any(axis=1)      #all blanks: no solution stored
+                else:
+                    yield start, puzzles, None, np.zeros(len(puzzles), dtype=bool)
+        return
+    stream = sys.stdin if args.input == '-' else open(args.input)
+    try:
+        lines = read_puzzles(stream)
+        start = 0
+        while True:
+            fields = [line.split() for _, line in zip(range(block), lines)]
+            if not fields:
+                return
+            puzzles = [f[0] for f in fields]
+            solutions = [f[1] if len(f) > 1 and f[1] != '-' else None for f in fields]
+            yield start, puzzles, solutions, np.array([s is not None for s in solutions], dtype=bool)
+            start += len(fields)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def run_validate(args):     #--validate: one report per input line, exit code 1 when any board is invalid
+    import numpy as np
+    from validate import Report
+    ok = Report()
+    out = sys.stdout
+    invalid = 0
+    for start, puzzles, solutions, has_solution in validation_blocks(args):
+        batch = validate_batch(puzzles, complete=args.complete)
+        reports = {k: (batch[k], 'puzzle') for k in batch.invalid().tolist()}     #row -> (report, column), invalid rows
+        rows = np.flatnonzero(has_solution & batch.valid)
+        if len(rows):
+            take = (lambda seq: seq[rows]) if isinstance(puzzles, np.ndarray) else (lambda seq: [seq[k] for k in rows])
+            checked = validate_batch(take(solutions), complete=True, puzzles=take(puzzles))
+            for k in checked.invalid().tolist():
+                reports[int(rows[k])] = (checked[k], 'solution')
+        invalid += len(reports)
+        for k in range(len(batch)):
+            report, column = reports.get(k, (ok, 'puzzle'))
+            if args.json:
+                line = json.dumps({'index': start + k, 'column': column, **report.as_dict()}, separators=(',', ':'))
+            else:
+                line = f'INVALID: {column} {report}' if k in reports else 'OK'
+            out.write(line + '\n')
+    return 1 if invalid else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m cli', description='Solve sudoku puzzles line by line.')
+    parser.add_argument('input', nargs='?', default='-', help="puzzle file or packed store, '-' (default) reads stdin")
+    parser.add_argument('--json', action='store_true', help='write one JSON record with stats and timing per puzzle')
+    parser.add_argument('--workers', type=int, default=0, help='worker processes, 0 (default) solves in this process')
+    parser.add_argument('--chunksize', type=int, default=64, help='puzzles handed to a worker at a time')
+    parser.add_argument('--engine', choices=ENGINES, default='ac3', help='search engine (default: ac3)')
+    parser.add_argument('--timeout', type=float, help='give up on a puzzle after this many seconds of search')
+    parser.add_argument('--max-nodes', type=int, help='give up on a puzzle after this many search nodes')
+    parser.add_argument('--max-depth', type=int, help='give up on a puzzle whose search goes deeper than this')
+    parser.add_argument('--store', help='also write the puzzles and their solutions to this packed store')
+    parser.add_argument('--validate', action='store_true', help="check the puzzles (and 'puzzle solution' lines) instead of solving them")
+    parser.add_argument('--complete', action='store_true', help='with --validate: the puzzle column must hold complete grids')
+    args = parser.parse_args(argv)
+    if args.validate:
+        try:
+            return run_validate(args)
+        except BrokenPipeError:
+            sys.stderr.close()
+            return 1
+    limits = {name: value for name, value in
+              (('timeout', args.timeout), ('max_nodes', args.max_nodes), ('max_depth', args.max_depth))
+              if value is not None}
+
+    if args.input != '-' and is_store(args.input):
+        stream = PuzzleStore(args.input)
+        puzzles = iter(stream)
+    else:
+        stream = sys.stdin if args.input == '-' else open(args.input)
+        puzzles = read_puzzles(stream)
+    writer = PuzzleWriter(args.store, solutions=True) if args.store else None
+    failures = unstored = 0
+    try:
+        out = sys.stdout
+        for result in solve_stream(puzzles, workers=args.workers, chunksize=args.chunksize,
+                                   engine=args.engine, limits=limits):
+            failures += not result['solved']
+            if writer:
+                try:
+                    writer.write(result['puzzle'], result['solution'])
+                except ValueError:      #malformed, or not 9x9: the store only holds 9x9 boards
+                    unstored += 1
+            out.write(format_result(result, args.json) + '\n')
+    except BrokenPipeError:         #reader went away (e.g. piped into head), nothing left to report
+        sys.stderr.close()
+        return 1
+    finally:
+        if writer:
+            writer.close()
+            if unstored:
+                print(f'{unstored} puzzles not written to {args.store}: not valid 9x9 puzzles', file=sys.stderr)
+        if stream is not sys.stdin:
+            stream.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,4 +4,16 @@ HARD_PUZZLE=                "029000000000600090000740102907000003030807010050093
 EXPERT_PUZZLE=              "400100000000300705050004006100000420060005300300000060030600900600001007800000610"
 EXTREME_PUZZLE=             "060007000010000700000065009000000040304900000500072000000103090000000006290000500"
 MASTER_PUZZLE=              "000514007000300092400800000007000100802600050000000000100070008006008205000040030"
-CUSTOM =                    "000000000000003085001020000000507000004000100090000000500000073002010000000040009" 
+CUSTOM =                    "000000000000003085001020000000507000004000100090000000500000073002010000000040009"
+
+# A 16x16 puzzle (order 4), values 1..9 then A..G
+PUZZLE_16X16 =              "0B0DC00000500E4000G0740000A000590040000000D6F800758E0G00004000C00C000000B002641501900E02AD00B0008050000060GC007E00D0400001000A920000052BCE3100000E20F06047000G80B007A8002000006010C000D0000000000000BA0E090020000000G9F0060300002G000000E000C00709E00038DG000B00"
+
+# Difficulty tiers from easiest to hardest, and the most search nodes SudokuCSP ('ac3' engine) may need
+# for a puzzle to be rated in each tier. The last tier has no upper bound.
+# The limits depend on the search order, so they are re-measured whenever it changes: on a seeded sample of
+# generated puzzles at every tier's hole count, each limit keeps the share of puzzles at or below it that the
+# first limits (1, 4, 12, 40, 150) had under the search they were set for. benchmark_corpus.txt is regenerated
+# with them (python -m benchmark --make-corpus)
+DIFFICULTIES =              ('EASY', 'MEDIUM', 'HARD', 'EXPERT', 'EXTREME', 'MASTER')
+DIFFICULTY_MAX_NODES =      (1, 4, 12, 34, 92)
@@ -0,0 +1,207 @@
+from backend import FROM_CHARS, TO_CHARS, geometry, order_of
+
+# Knuth's Algorithm X with Dancing Links over the exact cover matrix of a sudoku. For a board of side values and
+# size = side * side cells there are 4 * size columns: size "cell is filled" + size "row has digit" + size
+# "column has digit" + size "box has digit" (324 for 9x9). Rows: the size * side candidates (cell, digit),
+# each covering exactly 4 columns.
+
+ROOT = 0
+CANDIDATE_COLUMNS = {}      #order -> candidate -> its 4 columns
+
+
+def _candidate_columns(candidate, order=3):     #the 4 columns covered by candidate = cell * side + digit - 1
+    geo = geometry(order)
+    side, size = geo.side, geo.size
+    cell, d = divmod(candidate, side)
+    row, col = geo.coords[cell]
+    return (cell, size + row * side + d, 2 * size + col * side + d, 3 * size + geo.box_of[cell] * side + d)
+
+
+def candidate_columns(order=3):     #the columns of every candidate of a board of this order, built once per order
+    if order not in CANDIDATE_COLUMNS:
+        geo = geometry(order)
+        CANDIDATE_COLUMNS[order] = tuple(_candidate_columns(candidate, order) for candidate in range(geo.size * geo.side))
+    return CANDIDATE_COLUMNS[order]
+
+
+N_COLS = 324        #columns of the 9x9 matrix
+COLUMNS = candidate_columns(3)
+
+
+class DancingLinks:
+    # The matrix is built already reduced by the givens: columns they satisfy are left out, and so are the
+    # candidates that clash with them. That is much cheaper than building all the rows and covering the givens.
+    def __init__(self, grid, order=None):       #grid: puzzle string or sequence of 0..side values
+        values = list(grid.encode().translate(FROM_CHARS)) if isinstance(grid, str) else [int(value) for value in grid]
+        self.order = order_of(len(values)) if order is None else order
+        geo = geometry(self.order)
+        if len(values) != geo.size:
+            raise ValueError(f"a board of order {self.order} has {geo.size} cells, not {len(values)}")
+        side = self.side = geo.side
+        n_cols = 4 * geo.size
+        columns_of = candidate_columns(self.order)
+        self.givens = [(cell, value) for cell, value in enumerate(values) if value]
+        self.stats = {'nodes': 0, 'backtracks': 0}
+        self.checking = False       #when set, check(nodes, depth) runs at every node and may raise to stop search
+        self.check = None
+        self.chosen = []            #candidates on the current search path
+
+        satisfied = bytearray(n_cols)
+        self.consistent = True
+        for cell, value in self.givens:
+            if value > side:        #not a digit of this board
+                self.consistent = False
+                continue
+            for c in columns_of[cell * side + value - 1]:
+                if satisfied[c]:        #two givens clash
+                    self.consistent = False
+                satisfied[c] = 1
+
+        # headers: node 0 is the root, open column c gets node header[c]
+        header = [0] * n_cols
+        open_columns = [c for c in range(n_cols) if not satisfied[c]]
+        n = len(open_columns) + 1
+        for k, c in enumerate(open_columns, 1):
+            header[c] = k
+        L = [(h - 1) % n for h in range(n)]
+        R = [(h + 1) % n for h in range(n)]
+        U = list(range(n))
+        D = list(range(n))
+        C = list(range(n))
+        S = [0] * n
+        ROW = [-1] * n
+
+        for cell in range(geo.size):
+            if values[cell]:
+                continue
+            for candidate in range(cell * side, cell * side + side):
+                columns = columns_of[candidate]
+                if satisfied[columns[1]] or satisfied[columns[2]] or satisfied[columns[3]]:
+                    continue
+                first = len(C)
+                for k, c in enumerate(columns):
+                    h = header[c]
+                    node = first + k
+                    L.append(first + (k - 1) % 4)
+                    R.append(first + (k + 1) % 4)
+                    U.append(U[h])
+                    D.append(h)
+                    C.append(h)
+                    ROW.append(candidate)
+                    D[U[h]] = node
+                    U[h] = node
+                    S[h] += 1
+
+        self.L, self.R, self.U, self.D, self.C, self.S, self.ROW = L, R, U, D, C, S, ROW
+
+    def cover(self, c):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        R[L[c]] = R[c]
+        L[R[c]] = L[c]
+        i = D[c]
+        while i != c:
+            j = R[i]
+            while j != i:
+                D[U[j]] = D[j]
+                U[D[j]] = U[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+
+    def uncover(self, c):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        i = U[c]
+        while i != c:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                D[U[j]] = j
+                U[D[j]] = j
+                j = L[j]
+            i = U[i]
+        R[L[c]] = c
+        L[R[c]] = c
+
+    def search(self, limit=1):
+        # Depth-first Algorithm X. Yields every solution as a list of cell values, stopping after `limit` (None = all)
+        if not self.consistent:
+            return
+        L, R, D, C, S, ROW = self.L, self.R, self.D, self.C, self.S, self.ROW
+        cover, uncover, stats = self.cover, self.uncover, self.stats
+        side = self.side
+        base = [0] * (side * side)
+        for cell, value in self.givens:
+            base[cell] = value
+        chosen = self.chosen = []
+        found = 0
+
+        def recurse():
+            nonlocal found
+            stats['nodes'] += 1
+            if self.checking:
+                self.check(stats['nodes'], len(chosen))
+            if R[ROOT] == ROOT:
+                solution = base.copy()
+                for candidate in chosen:
+                    solution[candidate // side] = candidate % side + 1
+                found += 1
+                yield solution
+                return
+
+            # column with the fewest remaining candidates (MRV)
+            c = R[ROOT]
+            size = S[c]
+            j = R[c]
+            while j != ROOT and size > 1:
+                if S[j] < size:
+                    c, size = j, S[j]
+                j = R[j]
+            if size == 0:
+                stats['backtracks'] += 1
+                return
+
+            cover(c)
+            r = D[c]
+            while r != c:
+                chosen.append(ROW[r])
+                j = R[r]
+                while j != r:
+                    cover(C[j])
+                    j = R[j]
+
+                yield from recurse()
+
+                j = L[r]
+                while j != r:
+                    uncover(C[j])
+                    j = L[j]
+                chosen.pop()
+                if limit is not None and found >= limit:
+                    break
+                r = D[r]
+            uncover(c)
+
+        yield from recurse()
+
+    def solve(self):        #first solution as a list of cell values, or None
+        return next(self.search(limit=1), None)
+
+    def count_solutions(self, limit=None):      #number of solutions, stops counting at limit
+        return sum(1 for _ in self.search(limit=limit))
+
+
+def solve(puzzle_str):      #solution string for a puzzle string of any supported order, or None
+    solution = DancingLinks(puzzle_str).solve()
+    return bytes(solution).translate(TO_CHARS).decode() if solution else None
+
+
+def count_solutions(puzzle_str, limit=None):
+    return DancingLinks(puzzle_str).count_solutions(limit=limit)
+
+
+# Example usage
+if __name__ == "__main__":
+    import const
+    print(solve(const.EXTREME_PUZZLE))
+    print(f'Solutions of an empty board (capped at 1000): {count_solutions("0" * 81, limit=1000)}')
+    print(solve('0' * 256))
@@ -1,20 +1,24 @@
 import tkinter as tk
 import sys
 import time
+import queue
+import threading
 import const as const
 from tkinter import scrolledtext, messagebox  # Import for the log window
 from backend import SudokuCSP  # Adjust the import if the backend is named differently
-from Log import LogStream
+from Log import LogStream, LogView, log_file_for
 
+POLL_MS = 100  # how often the Tk loop checks a running solve for progress and its result
 
 
 
 
 
 class SudokuGUI:
-    def __init__(self, root, selected_mode,logging=False):
+    def __init__(self, root, selected_mode,logging=False,engine='ac3'):
         self.root = root
         self.selected_mode = selected_mode
+        self.engine = engine  # search engine passed to SudokuCSP.solve
         self.root.title("Sudoku Solver")
         if selected_mode != 0:
             self.root.geometry("600x700")
@@ -33,6 +37,8 @@ class SudokuGUI:
         self.create_cells()
         self.generated_puzzle = None
         self.generated_empty_spaces = 40  # Default value
+        self.solving = None  # SudokuCSP of the solve running in the worker thread
+        self.solve_results = queue.Queue()  # worker thread -> Tk loop, one item per finished solve
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         self.mode_1_setup(selected_mode)
         self.mode_2_setup(selected_mode)
@@ -150,6 +156,7 @@ class SudokuGUI:
                  
     def on_closing(self):
         if tk.messagebox.askokcancel("Quit", "Are you sure you want to quit?"):
+            self.cancel_solve()
             if hasattr(sys.stdout, 'stop'):
                 sys.stdout.stop()
             tk.messagebox.showinfo("Sudoku Solver", "Thank you for using the Sudoku Solver!")
@@ -162,6 +169,18 @@ class SudokuGUI:
         self.log_window.geometry("600x400")
         self.log_window.resizable(True, True)
 
+        # Paging buttons, packed first so they stay visible when the window shrinks
+        log_buttons = tk.Frame(self.log_window)
+        log_buttons.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=(0, 10))
+        tk.Button(log_buttons, text="Older", command=lambda: self.log_view.page_older()).pack(side=tk.LEFT)
+        tk.Button(log_buttons, text="Live", command=lambda: self.log_view.follow()).pack(side=tk.LEFT, padx=5)
+
+        # Progress of a running solve and the button that stops it
+        self.cancel_button = tk.Button(log_buttons, text="Cancel", command=self.cancel_solve, state='disabled')
+        self.cancel_button.pack(side=tk.RIGHT)
+        self.progress_label = tk.Label(log_buttons, text="")
+        self.progress_label.pack(side=tk.RIGHT, padx=5)
+
         self.log_text = scrolledtext.ScrolledText(
             self.log_window,
             width=70, height=20,
@@ -169,6 +188,7 @@ class SudokuGUI:
             state='disabled'
         )
         self.log_text.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+        self.log_view = LogView(self.log_text)  # keeps the widget to the last lines, older ones are paged from the log file
         return self.log_text  # <-- ADD THIS
     
     def on_generate_clicked(self):
@@ -254,23 +274,8 @@ class SudokuGUI:
         # Fill the GUI board
         
 
-        print("Starting to solve Example puzzle...")
-
         # === BACKEND SOLVE ===
-        csp = SudokuCSP(puzzle_str,self.logging)
-        start_time=time.time()
-        csp.solve()
-        end_time=time.time()
-        grid_2d = self.board_from_string(csp.grid)
-        self.set_board(grid_2d)
-        
-
-        print("Example puzzle solved.")
-        print("Solved Board:\n")
-        print(f"solved in:{end_time-start_time:.2f} seconds \n")
-        
-        self.print_grid(grid_2d)
-        print("\n\n\n")
+        self.start_solve(puzzle_str, "Example")
 
    
     def get_current_board(self):
@@ -295,23 +300,69 @@ class SudokuGUI:
         self.print_grid(self.board_from_string(puzzle))
         print("\n\n")
 
-        print("Starting to solve user input puzzle...")
-
         # Solve using CSP backend
-        csp = SudokuCSP(puzzle,self.logging)
-        start_time = time.time()
-        csp.solve()
+        self.start_solve(puzzle, "User input")
+
+    def start_solve(self, puzzle_str, name):
+        # Solve in a worker thread so the window stays responsive, poll_solve picks up progress and the result
+        if self.solving is not None:
+            print("A solve is already running, cancel it first.")
+            return
+        print(f"Starting to solve {name} puzzle...")
+        csp = SudokuCSP(puzzle_str,self.logging)
+        self.solving = csp
+        self.solve_start = time.time()
+        self.cancel_button.config(state='normal')
+        rate = puzzle_str == self.generated_puzzle and hasattr(sys.stdout, 'set_file')
+        if not rate and hasattr(sys.stdout, 'set_file'):        #back from the file of a generated puzzle's tier
+            sys.stdout.set_file(log_file_for(self.selected_mode))
+        threading.Thread(target=self.run_solve, args=(csp, name, rate), daemon=True).start()
+        self.root.after(POLL_MS, self.poll_solve)
+
+    def run_solve(self, csp, name, rate=False):
+        # Worker thread: never touches Tk, the outcome goes back through the result queue
+        try:
+            if rate:
+                # log the solve of a generated puzzle to the file of its difficulty, rating it takes a solve of its own
+                from suduko_generator import ratePuzzle
+                difficulty, _, _ = ratePuzzle(csp.grid)
+                sys.stdout.set_file(log_file_for(difficulty=difficulty))
+            self.solve_results.put((csp, name, csp.solve(self.engine), None))
+        except Exception as e:
+            self.solve_results.put((csp, name, False, e))
+
+    def poll_solve(self):
+        nodes, depth = self.solving.progress()
+        self.progress_label.config(text=f"nodes: {nodes}  depth: {depth}")
+        try:
+            csp, name, solved, error = self.solve_results.get_nowait()
+        except queue.Empty:
+            self.root.after(POLL_MS, self.poll_solve)
+            return
+
         end_time = time.time()
+        self.solving = None
+        self.cancel_button.config(state='disabled')
+        if error is not None:
+            print(f"{name} puzzle failed: {error}")
+            return
+        if not solved:
+            print(f"{name} puzzle {'solve cancelled' if csp.cancelled else 'could not be solved'}.")
+            return
 
         # Convert solved grid to 2D list
         grid_2d = self.board_from_string(csp.grid)
         self.set_board(grid_2d)
 
-        print("User input puzzle solved.")
+        print(f"{name} puzzle solved.")
         print("Solved Board:\n")
-        print(f"solved in:{end_time-start_time:.2f} seconds\n")
+        print(f"solved in:{end_time-self.solve_start:.2f} seconds\n")
         self.print_grid(grid_2d)
         print("\n\n")
+
+    def cancel_solve(self):
+        if self.solving is not None:
+            self.solving.cancel()  # the search stops at its next node, poll_solve then reports it
     
     def board_from_string(self, puzzle_str):
         return [[int(puzzle_str[i * 9 + j]) for j in range(9)] for i in range(9)]
@@ -344,8 +395,7 @@ class SudokuGUI:
 
 
     def update_log(self, message):
-        self.log_text.insert(tk.END, message + "\n")
-        self.log_text.yview(tk.END)  # Auto-scroll to the latest message
+        self.log_view.append(message + "\n")  # shown on the view's next frame
     def set_mode3_board(self, board):
         for i in range(9):
             for j in range(9):
@@ -428,18 +478,22 @@ class SudokuGUI:
 
 
 
-def run_gui(mode,logging=False):
+def run_gui(mode,logging=False,engine='ac3'):
     root = tk.Tk()
-    gui = SudokuGUI(root,selected_mode=mode,logging=logging)
-    sys.stdout = LogStream(gui.log_text,file="log_MASTER.txt", flush_interval=0.1)  # Redirect stdout to the log window
+    gui = SudokuGUI(root,selected_mode=mode,logging=logging,engine=engine)
+    sys.stdout = LogStream(gui.log_view,file=log_file_for(mode), flush_interval=0.1)  # Redirect stdout to the log window
     
     # if log_to_file==True:
-    #     sys.stdout = LogStream(gui.log_text)
+    #     sys.stdout = LogStream(gui.log_view)
         
     if mode == 0:
         gui.solve_example()
     root.mainloop()
+    if hasattr(sys.stdout, 'stop'):
+        sys.stdout.stop()
+    sys.stdout = sys.__stdout__     #the log window is gone, print to the terminal again
     
     root.destroy()
     
-run_gui(0,True)
\ No newline at end of file
+if __name__ == "__main__":
+    run_gui(0,True)
@@ -0,0 +1,129 @@
+from backend import mask_to_str, trace
+
+# Unit-based inference rules, the deductions a human solver makes before guessing.
+# A rule takes a SudokuCSP, narrows domains through csp.set_domain (so search can undo it), counts every
+# deduction in csp.stats['rules'][<rule name>] and returns the list of cells it narrowed, or None when it
+# finds a contradiction. SudokuCSP.apply_rules runs the selected rules to a fixpoint.
+# Units, lines and masks come from csp.geo, so the rules work on boards of every order.
+
+
+def fired(csp, rule, cell):        #count a deduction that narrowed cell, traced as 'rule <name> <cell> <new domain>'
+    csp.stats['rules'][rule] += 1
+    if csp.tracing:
+        trace('rule', rule, csp.geo.cell_names[cell], mask_to_str(csp.domains[cell]))
+
+
+def hidden_singles(csp):        #a value with only one possible cell in a unit goes in that cell
+    domains, geo = csp.domains, csp.geo
+    popcount, all_values = geo.popcount, geo.all_values
+    changed = []
+    for unit in geo.units:
+        once = twice = 0
+        for cell in unit:
+            d = domains[cell]
+            twice |= once & d
+            once |= d
+        if once != all_values:      #some value has no cell left in this unit
+            return None
+        singles = once & ~twice
+        if not singles:
+            continue
+        for cell in unit:
+            d = domains[cell]
+            hit = d & singles
+            if hit and hit != d:
+                if popcount[hit] > 1:       #two values can only go in this one cell
+                    return None
+                csp.set_domain(cell, hit)
+                changed.append(cell)
+                fired(csp, 'hidden_singles', cell)
+    return changed
+
+
+def naked_pairs(csp):       #two cells of a unit sharing the same two values take them from the rest of the unit
+    domains, board = csp.domains, csp.board
+    popcount = csp.geo.popcount
+    changed = []
+    for unit in csp.geo.units:
+        pairs = {}
+        for cell in unit:
+            d = domains[cell]
+            if board[cell] or popcount[d] != 2:
+                continue
+            if d not in pairs:
+                pairs[d] = cell
+                continue
+            other = pairs[d]
+            for peer in unit:
+                if peer != cell and peer != other and domains[peer] & d:
+                    csp.set_domain(peer, domains[peer] & ~d)
+                    changed.append(peer)
+                    fired(csp, 'naked_pairs', peer)
+    return changed
+
+
+def hidden_pairs(csp):      #two values that fit the same two cells of a unit only, and nowhere else, claim those cells
+    domains, board, geo = csp.domains, csp.board, csp.geo
+    popcount, value_bits = geo.popcount, geo.bit[1:]
+    changed = []
+    for unit in geo.units:
+        pair_values = {}        #pair of unit positions -> values restricted to exactly those positions
+        for value_bit in value_bits:
+            positions = 0
+            count = 0
+            for k, cell in enumerate(unit):
+                if domains[cell] & value_bit:
+                    if board[cell]:
+                        break
+                    positions |= 1 << k
+                    count += 1
+                    if count > 2:
+                        break
+            else:
+                if count == 2:
+                    pair_values[positions] = pair_values.get(positions, 0) | value_bit
+
+        for positions, values in pair_values.items():
+            if popcount[values] != 2:
+                continue
+            for k, cell in enumerate(unit):
+                if positions >> k & 1 and domains[cell] != values:
+                    csp.set_domain(cell, domains[cell] & values)
+                    changed.append(cell)
+                    fired(csp, 'hidden_pairs', cell)
+    return changed
+
+
+def pointing_pairs(csp):        #values of a box confined to one row / column are removed from the rest of that line
+    domains, board, geo = csp.domains, csp.board, csp.geo
+    box_of = geo.box_of
+    changed = []
+    for box in geo.boxes:
+        for lines, line_of in geo.lines:
+            # values still open in each of the box's lines
+            open_in = {}
+            for cell in box:
+                if not board[cell]:
+                    line = line_of[cell]
+                    open_in[line] = open_in.get(line, 0) | domains[cell]
+            for line, values in open_in.items():
+                for other, other_values in open_in.items():
+                    if other != line:
+                        values &= ~other_values
+                if not values:
+                    continue
+                for cell in lines[line]:
+                    if box_of[cell] != box_of[box[0]] and domains[cell] & values and not board[cell]:
+                        csp.set_domain(cell, domains[cell] & ~values)
+                        changed.append(cell)
+                        fired(csp, 'pointing_pairs', cell)
+    return changed
+
+
+# Rules by name, cheapest first. SudokuCSP runs them in this order and starts over after any rule fires
+RULES = {
+    'hidden_singles': hidden_singles,
+    'naked_pairs': naked_pairs,
+    'hidden_pairs': hidden_pairs,
+    'pointing_pairs': pointing_pairs,
+}
@@ -0,0 +1,46 @@
+import time
+
+# Per-phase profiling of SudokuCSP. SudokuCSP(profiler=Profiler()) hands the methods of every phase
+# (backend.PROFILED_PHASES) to wrap(), which replaces them on that one instance by timed versions. Without a
+# profiler the plain methods run, so profiling costs nothing when it is off. Any object with a wrap(phase, method)
+# method can serve as the hook.
+
+
+class Profiler:
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.calls = {}         #phase -> number of calls
+        self.time = {}          #phase -> seconds spent inside them
+
+    def wrap(self, phase, method):
+        clock, calls, spent = self.clock, self.calls, self.time
+        calls.setdefault(phase, 0)
+        spent.setdefault(phase, 0.0)
+
+        def timed(*args):
+            start = clock()
+            try:
+                return method(*args)
+            finally:
+                spent[phase] += clock() - start
+                calls[phase] += 1
+        return timed
+
+    def report(self):       #{phase: {'calls', 'time'}} in the order the phases were wrapped
+        return {phase: {'calls': self.calls[phase], 'time': self.time[phase]} for phase in self.calls}
+
+    def __str__(self):
+        lines = [f"{'phase':<18}{'calls':>9}{'ms':>11}{'us/call':>10}"]
+        for phase, row in self.report().items():
+            per_call = row['time'] / row['calls'] * 1e6 if row['calls'] else 0.0
+            lines.append(f"{phase:<18}{row['calls']:>9}{row['time'] * 1000:>11.3f}{per_call:>10.2f}")
+        return '\n'.join(lines)
+
+
+# Example usage
+if __name__ == "__main__":
+    import const
+    from backend import SudokuCSP
+    profiler = Profiler()
+    result = SudokuCSP(const.EXTREME_PUZZLE, logging='off', rules=(), profiler=profiler).solve()
+    print(f'{result!r}\n{profiler}')
@@ -0,0 +1,275 @@
+import argparse
+import mmap
+import struct
+import sys
+
+import const
+from backend import parse_puzzle
+
+# Packed binary puzzle store for 9x9 corpora: python -m store pack|unpack|info ...
+# A file is a 16-byte header followed by fixed-size records, so record k starts at HEADER.size + k * record_size
+# and any puzzle can be read without scanning the file. Cells take 4 bits each, two per byte in reading order
+# (the first cell in the high nibble), which makes the 41 packed bytes of a puzzle exactly the bytes whose hex()
+# is the puzzle string with a '0' appended. Packing and unpacking are therefore single C calls (bytes.fromhex,
+# bytes.hex). A record holds:
+#   41 bytes  puzzle, blanks as 0
+#   41 bytes  solution, only when the file has FLAG_SOLUTIONS
+#   1 byte    difficulty as an index into const.DIFFICULTIES (NO_DIFFICULTY if unrated), only with FLAG_DIFFICULTY
+# Header: magic b'SDKP', format version, flags, reserved, record count (little endian).
+
+MAGIC = b'SDKP'
+VERSION = 1
+HEADER = struct.Struct('<4sBBHQ')
+PACKED_SIZE = 41        #bytes of one packed 81-cell grid
+FLAG_SOLUTIONS = 1
+FLAG_DIFFICULTY = 2
+NO_DIFFICULTY = 0xFF
+
+
+def pack(puzzle):       #81-character puzzle ('0' or '.' for blanks) -> 41 packed bytes
+    return bytes.fromhex(parse_puzzle(puzzle, order=3) + '0')
+
+
+def unpack(data):       #41 packed bytes (bytes, memoryview, ...) -> 81-character puzzle string
+    return data.hex()[:81]
+
+
+def is_store(path):     #True when the file starts with the store magic
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def record_size(flags):
+    return PACKED_SIZE + (PACKED_SIZE if flags & FLAG_SOLUTIONS else 0) + (1 if flags & FLAG_DIFFICULTY else 0)
+
+
+class PuzzleWriter:
+    # Writes a store record by record, so corpora of any size stream straight to disk. The record count in the
+    # header is filled in by close(). Use as a context manager:
+    #   with PuzzleWriter('corpus.sdkp', solutions=True) as writer:
+    #       writer.write(puzzle, solution)
+    def __init__(self, path, solutions=False, difficulty=False):
+        self.flags = (FLAG_SOLUTIONS if solutions else 0) | (FLAG_DIFFICULTY if difficulty else 0)
+        self.count = 0
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.flags, 0, 0))
+
+    def write(self, puzzle, solution=None, difficulty=None):
+        record = pack(puzzle)
+        if self.flags & FLAG_SOLUTIONS:
+            record += pack(solution) if solution else bytes(PACKED_SIZE)       #all blanks: no solution known
+        if self.flags & FLAG_DIFFICULTY:
+            record += bytes((NO_DIFFICULTY if difficulty is None else const.DIFFICULTIES.index(difficulty),))
+        self.file.write(record)
+        self.count += 1
+
+    def write_many(self, records):      #puzzle strings, or dicts with 'puzzle' and optional 'solution' / 'difficulty'
+        for record in records:
+            if isinstance(record, str):
+                self.write(record)
+            else:
+                self.write(record['puzzle'], record.get('solution'), record.get('difficulty'))
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.flags, 0, self.count))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_store(path, records, solutions=None, difficulty=None):
+    # Write puzzle strings or generator / batch result dicts to a new store. Without explicit flags the columns
+    # are taken from the first record: solutions when it has a 'solution' key, difficulty when it has 'difficulty'
+    records = iter(records)
+    first = next(records, None)
+    if isinstance(first, dict):
+        solutions = 'solution' in first if solutions is None else solutions
+        difficulty = 'difficulty' in first if difficulty is None else difficulty
+    with PuzzleWriter(path, bool(solutions), bool(difficulty)) as writer:
+        if first is not None:
+            writer.write_many([first])
+            writer.write_many(records)
+        return writer.count
+
+
+class PuzzleStore:
+    # Read-only, memory-mapped view of a store. Only the header is read when opening, records are paged in by
+    # the OS as they are touched. store[k] / store[a:b] give puzzle strings, view(k) the packed bytes of a puzzle
+    # as a zero-copy memoryview, packed() / digits() NumPy arrays of many. The memoryviews and packed() arrays
+    # point into the mapping, so they have to be released before close()
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise ValueError(f'{path}: not a puzzle store, the file is too short')
+            magic, version, self.flags, _, self.count = HEADER.unpack(header)
+            if magic != MAGIC:
+                raise ValueError(f'{path}: not a puzzle store, bad magic {magic!r}')
+            if version != VERSION:
+                raise ValueError(f'{path}: unsupported store version {version}, expected {VERSION}')
+            self.record_size = record_size(self.flags)
+            expected = HEADER.size + self.count * self.record_size
+            f.seek(0, 2)
+            if f.tell() < expected:
+                raise ValueError(f'{path}: truncated, {self.count} records need {expected} bytes, got {f.tell()}')
+            self.map = mmap.mmap(f.fileno(), expected, access=mmap.ACCESS_READ) if self.count else None
+        self.buffer = memoryview(self.map) if self.map is not None else memoryview(b'')
+
+    @property
+    def has_solutions(self):
+        return bool(self.flags & FLAG_SOLUTIONS)
+
+    @property
+    def has_difficulty(self):
+        return bool(self.flags & FLAG_DIFFICULTY)
+
+    def __len__(self):
+        return self.count
+
+    def offset(self, index):        #byte offset of record index, negative indices count from the end
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(f'record {index} out of range for a store of {self.count}')
+        return HEADER.size + index * self.record_size
+
+    def view(self, index, column=0):      #zero-copy memoryview of the packed puzzle (column 0) or solution (column 1)
+        start = self.offset(index) + column * PACKED_SIZE
+        return self.buffer[start:start + PACKED_SIZE]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[k] for k in range(*index.indices(self.count))]
+        return self.view(index).hex()[:81]
+
+    def __iter__(self, block=4096):       #hex() of a block of records at a time, then one slice per puzzle
+        buffer, step = self.buffer, 2 * self.record_size
+        end = HEADER.size + self.count * self.record_size
+        for start in range(HEADER.size, end, block * self.record_size):
+            text = buffer[start:min(end, start + block * self.record_size)].hex()
+            for k in range(0, len(text), step):
+                yield text[k:k + 81]
+
+    def solution(self, index):      #solution string of a record, None when the store has none for it
+        if not self.has_solutions:
+            return None
+        data = self.view(index, 1)
+        return data.hex()[:81] if any(data) else None
+
+    def difficulty(self, index):        #tier name from const.DIFFICULTIES, or None
+        if not self.has_difficulty:
+            return None
+        tier = self.buffer[self.offset(index) + self.record_size - 1]
+        return None if tier == NO_DIFFICULTY else const.DIFFICULTIES[tier]
+
+    def record(self, index):        #{'puzzle', 'solution', 'difficulty'} of one record
+        return {'puzzle': self[index], 'solution': self.solution(index), 'difficulty': self.difficulty(index)}
+
+    def records(self):
+        for k in range(self.count):
+            yield self.record(k)
+
+    def rows(self):     #(count, record_size) uint8 NumPy array over the whole mapping, zero-copy
+        import numpy as np
+        if not self.count:      #nothing is mapped
+            return np.empty((0, self.record_size), dtype=np.uint8)
+        return np.frombuffer(self.buffer, dtype=np.uint8, count=self.count * self.record_size,
+                             offset=HEADER.size).reshape(self.count, self.record_size)
+
+    def packed(self, index=slice(None), column=0):
+        # (n, 41) uint8 NumPy array of the packed puzzles (column 0) or solutions (column 1) of index (an int, a
+        # slice or an index array). Ints and slices give zero-copy views into the mapping, index arrays a copy
+        if column and not self.has_solutions:
+            raise ValueError(f'{self.path} holds no solutions')
+        if isinstance(index, int):
+            self.offset(index)      #IndexError when out of range
+            index = slice(index, index + 1 or None)
+        return self.rows()[index, column * PACKED_SIZE:(column + 1) * PACKED_SIZE]
+
+    def digits(self, index=slice(None), column=0):
+        # (n, 81) uint8 NumPy array of cell values 0..9, the layout vectorized.to_digits produces
+        import numpy as np
+        packed = self.packed(index, column)
+        digits = np.empty((len(packed), 2 * PACKED_SIZE), dtype=np.uint8)
+        digits[:, 0::2] = packed >> 4
+        digits[:, 1::2] = packed & 0x0F
+        return digits[:, :81]
+
+    def close(self):
+        self.buffer.release()
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_text(stream):      #puzzle lines of a text corpus, blank lines and '#' comments skipped
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line.split()[-1]      #'<group> <puzzle>' lines (benchmark_corpus.txt) keep the puzzle
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m store', description='Convert puzzle corpora to and from the packed store.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    to_store = commands.add_parser('pack', help='pack a text corpus (one puzzle per line) into a store')
+    to_store.add_argument('input', help="text corpus, '-' reads stdin")
+    to_store.add_argument('output', help='store file to write')
+    to_text = commands.add_parser('unpack', help='write the puzzles of a store as text lines')
+    to_text.add_argument('input', help='store file')
+    to_text.add_argument('--solutions', action='store_true', help="append the solution to every line ('puzzle solution')")
+    info = commands.add_parser('info', help='print the header of a store')
+    info.add_argument('input', help='store file')
+    args = parser.parse_args(argv)
+
+    if args.command == 'pack':
+        stream = sys.stdin if args.input == '-' else open(args.input)
+        try:
+            count = write_store(args.output, read_text(stream))
+        except ValueError as e:         #a line that is not a 9x9 puzzle, the store keeps the ones before it
+            print(f'ERROR: {e}', file=sys.stderr)
+            return 1
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        print(f'{count} puzzles written to {args.output}', file=sys.stderr)
+        return 0
+
+    with PuzzleStore(args.input) as store:
+        if args.command == 'info':
+            print(f'{args.input}: {len(store)} puzzles, {store.record_size} bytes per record, '
+                  f'solutions: {store.has_solutions}, difficulty: {store.has_difficulty}')
+            return 0
+        out = sys.stdout
+        try:
+            if args.solutions:
+                for k, puzzle in enumerate(store):
+                    out.write(f'{puzzle} {store.solution(k) or "-"}\n')
+            else:
+                for puzzle in store:
+                    out.write(puzzle + '\n')
+        except BrokenPipeError:         #reader went away (e.g. piped into head)
+            sys.stderr.close()
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,26 +1,37 @@
 # Python program to generate a valid sudoku 
 # with k empty cells
+# Grids are side x side lists of values, side = order * order (9 for the
+# classic board, 16 or 25 for the larger ones), the box side is the order
 
+import math
 import random
+import const
+from backend import SudokuCSP, SYMBOLS, DEFAULT_RULES, BudgetExceeded, geometry
 
-# Returns false if given 3x3 block contains num
+# Box side (the order) of a grid
+def boxSide(grid):
+    return math.isqrt(len(grid))
+
+# Returns false if given box contains num
 # Ensure the number is not used in the box
 def unUsedInBox(grid, rowStart, colStart, num):
-    for i in range(3):
-        for j in range(3):
+    n = boxSide(grid)
+    for i in range(n):
+        for j in range(n):
             if grid[rowStart + i][colStart + j] == num:
                 return False
     return True
 
-# Fill a 3x3 matrix
-# Assign valid random numbers to the 3x3 subgrid
-def fillBox(grid, row, col):
-    for i in range(3):
-        for j in range(3):
+# Fill a box
+# Assign valid random numbers to the subgrid
+def fillBox(grid, row, col, rng=random):
+    n = boxSide(grid)
+    for i in range(n):
+        for j in range(n):
             while True:
                 
-                # Generate a random number between 1 and 9
-                num = random.randint(1, 9)
+                # Generate a random number between 1 and side
+                num = rng.randint(1, n * n)
                 if unUsedInBox(grid, row, col, num):
                     break
             grid[row + i][col + j] = num
@@ -33,7 +44,7 @@ def unUsedInRow(grid, i, num):
 # Check if it's safe to put num in column j
 # Ensure num is not already used in the column
 def unUsedInCol(grid, j, num):
-    for i in range(9):
+    for i in range(len(grid)):
         if grid[i][j] == num:
             return False
     return True
@@ -41,36 +52,39 @@ def unUsedInCol(grid, j, num):
 # Check if it's safe to put num in the cell (i, j)
 # Ensure num is not used in row, column, or box
 def checkIfSafe(grid, i, j, num):
+    n = boxSide(grid)
     return (unUsedInRow(grid, i, num) and 
             unUsedInCol(grid, j, num) and 
-            unUsedInBox(grid, i - i % 3, j - j % 3, num))
+            unUsedInBox(grid, i - i % n, j - j % n, num))
 
-# Fill the diagonal 3x3 matrices
+# Fill the diagonal boxes
 # The diagonal blocks are filled to simplify the process
-def fillDiagonal(grid):
-    for i in range(0, 9, 3):
+def fillDiagonal(grid, rng=random):
+    n = boxSide(grid)
+    for i in range(0, n * n, n):
         
-        # Fill each 3x3 subgrid diagonally
-        fillBox(grid, i, i)
+        # Fill each subgrid diagonally
+        fillBox(grid, i, i, rng)
 
 # Fill remaining blocks in the grid
 # Recursively fill the remaining cells with valid numbers
 def fillRemaining(grid, i, j):
+    side = len(grid)
     
     # If we've reached the end of the grid
-    if i == 9:
+    if i == side:
         return True
     
     # Move to next row when current row is finished
-    if j == 9:
+    if j == side:
         return fillRemaining(grid, i + 1, 0)
     
     # Skip if cell is already filled
     if grid[i][j] != 0:
         return fillRemaining(grid, i, j + 1)
     
-    # Try numbers 1-9 in current cell
-    for num in range(1, 10):
+    # Try numbers 1-side in current cell
+    for num in range(1, side + 1):
         if checkIfSafe(grid, i, j, num):
             grid[i][j] = num
             if fillRemaining(grid, i, j + 1):
@@ -79,49 +93,191 @@ def fillRemaining(grid, i, j):
     
     return False
 
+# Fill remaining blocks of a 16x16 or larger grid
+# Cell by cell backtracking gets lost on boards that big, so the exact cover
+# search of dlx.py completes the grid instead
+def fillRemainingLinks(grid):
+    from dlx import DancingLinks
+    side = len(grid)
+    solution = DancingLinks([cell for row in grid for cell in row], boxSide(grid)).solve()
+    if solution is None:
+        return False
+    for i in range(side):
+        grid[i] = solution[i * side:(i + 1) * side]
+    return True
+
+# Puzzle string of a grid, values above 9 are written as letters
+def gridToString(grid):
+    return ''.join(SYMBOLS[cell] for row in grid for cell in row)
+
+# Search nodes a uniqueness check may take on boards larger than 9x9
+# Proving uniqueness of a sparse 16x16 or 25x25 puzzle can take minutes, a
+# check that runs out of nodes counts as not unique and the digit stays
+UNIQUE_MAX_NODES = 20000
+
+# Check that the puzzle in grid still has exactly one solution
+# Counting stops at the second solution, so this costs about one solve
+def hasUniqueSolution(grid):
+    if len(grid) == 9:
+        return SudokuCSP(gridToString(grid), logging='off').has_unique_solution(engine='dlx')
+
+    from dlx import DancingLinks
+    links = DancingLinks([cell for row in grid for cell in row], boxSide(grid))
+    links.checking = True
+    links.check = checkUniqueBudget
+    try:
+        return links.count_solutions(limit=2) == 1
+    except BudgetExceeded:
+        return False
+
+def checkUniqueBudget(nodes, depth):
+    if nodes > UNIQUE_MAX_NODES:
+        raise BudgetExceeded('nodes', UNIQUE_MAX_NODES)
+
+# Check if the remaining digits still force num into the emptied cell
+# Either every other digit is used by a peer (naked single), or num has no
+# other place in one of the cell's units (hidden single). Then the puzzle keeps
+# the unique solution it had, without having to search for a second one
+def isForced(grid, cellId, num):
+    side = len(grid)
+    geo = geometry(boxSide(grid))
+    peerDigits = {grid[p // side][p % side] for p in geo.peers[cellId]}
+    if len(peerDigits - {0}) == side - 1:
+        return True
+    for unit in geo.units_of[cellId]:
+        if all(other == cellId or grid[other // side][other % side] != 0 or
+               any(grid[p // side][p % side] == num for p in geo.peers[other])
+               for other in unit):
+            return True
+    return False
+
 # Remove K digits randomly from the grid
 # This will create a Sudoku puzzle by removing digits
-def removeKDigits(grid, k):
-    while k > 0:
-        
-        # Pick a random cell
-        cellId = random.randint(0, 80)
+# A digit is only removed if the puzzle keeps a unique solution, so fewer
+# than K digits are removed when no other cell can be emptied safely
+def removeKDigits(grid, k, rng=random):
+    
+    # Visit the filled cells in random order
+    side = len(grid)
+    cells = [cellId for cellId in range(side * side) if grid[cellId // side][cellId % side] != 0]
+    rng.shuffle(cells)
 
-        # Get the row index
-        i = cellId // 9
+    for cellId in cells:
+        if k == 0:
+            break
 
-        # Get the column index
-        j = cellId % 9
+        # Get the row and column index
+        i = cellId // side
+        j = cellId % side
 
-        # Remove the digit if the cell is not already empty
-        if grid[i][j] != 0:
-            # Empty the cell
-            grid[i][j] = 0
+        # Empty the cell, and put the digit back if the solution is no longer unique
+        digit = grid[i][j]
+        grid[i][j] = 0
+        if isForced(grid, cellId, digit) or hasUniqueSolution(grid):
             # Decrease the count of digits to remove
             k -= 1
+        else:
+            grid[i][j] = digit
 
-# Generate a Sudoku grid with K empty cells
-def sudokuGenerator(k):
+# Generate a Sudoku grid of the given order with K empty cells
+def sudokuGenerator(k, rng=random, order=3):
     
-    # Initialize an empty 9x9 grid
-    grid = [[0] * 9 for _ in range(9)]
+    # Initialize an empty side x side grid
+    geometry(order)     # rejects unsupported orders
+    side = order * order
+    grid = [[0] * side for _ in range(side)]
 
-    # Fill the diagonal 3x3 matrices
-    fillDiagonal(grid)
+    # Fill the diagonal boxes
+    fillDiagonal(grid, rng)
 
     # Fill the remaining blocks in the grid
-    fillRemaining(grid, 0, 0)
+    if order <= 3:
+        fillRemaining(grid, 0, 0)
+    else:
+        fillRemainingLinks(grid)
 
     # Remove K digits randomly to create the puzzle
-    removeKDigits(grid, k)
+    removeKDigits(grid, k, rng)
 
     return grid
-def generate_sudoku_string(k):
-    grid = sudokuGenerator(k)
-    puzzle_str = ''.join(str(cell) for row in grid for cell in row)
+def generate_sudoku_string(k, rng=random, order=3):
+    grid = sudokuGenerator(k, rng, order)
+    puzzle_str = gridToString(grid)
     return puzzle_str
+
+# Cells to empty when aiming for each difficulty tier
+# Harder tiers dig until uniqueness stops them, the solver effort then decides the tier
+TIER_HOLES = {'EASY': 40, 'MEDIUM': 46, 'HARD': 51, 'EXPERT': 56, 'EXTREME': 64, 'MASTER': 64}
+
+# Cells to empty for a tier on a board of the given order
+# The 9x9 counts are kept as the same share of the cells on other boards
+def tierHoles(difficulty, order=3):
+    return TIER_HOLES[difficulty] * order ** 4 // 81
+
+# Rate a puzzle by the search nodes SudokuCSP needs to solve it
+# Inference rules stay off, const.DIFFICULTY_MAX_NODES is measured for plain AC-3
+# Larger boards keep the rules on, plain AC-3 gets lost on them
+# Returns the tier from const.DIFFICULTIES, the node count and the solution
+def ratePuzzle(puzzle_str):
+    rules = () if len(puzzle_str) == 81 else DEFAULT_RULES
+    csp = SudokuCSP(puzzle_str, logging='off', rules=rules)
+    csp.solve()
+    nodes = csp.stats['nodes']
+    for tier, max_nodes in zip(const.DIFFICULTIES, const.DIFFICULTY_MAX_NODES):
+        if nodes <= max_nodes:
+            return tier, nodes, csp.grid
+    return const.DIFFICULTIES[-1], nodes, csp.grid
+
+# Generate count rated puzzles with one RNG stream
+# With a difficulty, puzzles are generated until count of them rate in that tier
+def generateRated(count, difficulty, rng, order=3):
+    puzzles = []
+    while len(puzzles) < count:
+        holes = tierHoles(difficulty or rng.choice(const.DIFFICULTIES), order)
+        puzzle_str = generate_sudoku_string(holes, rng, order)
+        tier, nodes, solution = ratePuzzle(puzzle_str)
+        if difficulty is None or tier == difficulty:
+            puzzles.append({'puzzle': puzzle_str, 'solution': solution, 'difficulty': tier, 'nodes': nodes})
+    return puzzles
+
+def _generate_task(count, difficulty, seed, task, order=3):
+    # Every task owns its RNG stream, derived from the batch seed and the task index
+    rng = random.Random(f'{seed}/{task}') if seed is not None else random.Random()
+    return generateRated(count, difficulty, rng, order)
+
+# Generate n unique-solution puzzles spread over a process pool
+# Each result is {'puzzle', 'solution', 'difficulty', 'nodes'}. The same seed
+# and chunksize give the same puzzles in the same order for any worker count
+# The node limits of the tiers are measured on 9x9 boards, so larger boards
+# are rated as well but cannot be asked for a difficulty
+def generate_batch(n, difficulty=None, workers=None, seed=None, chunksize=16, order=3):
+    if difficulty is not None and difficulty not in const.DIFFICULTIES:
+        raise ValueError(f"unknown difficulty {difficulty!r}, expected one of {const.DIFFICULTIES}")
+    if difficulty is not None and order != 3:
+        raise ValueError(f"difficulty tiers are only calibrated for 9x9 boards, got order {order}")
+    geometry(order)
+    tasks = [(min(chunksize, n - start), difficulty, seed, task, order)
+             for task, start in enumerate(range(0, n, chunksize))]
+
+    if workers == 0:
+        chunks = [_generate_task(*args) for args in tasks]
+    else:
+        from batch import make_pool
+        with make_pool(workers) as pool:
+            chunks = list(pool.map(_generate_task, *zip(*tasks))) if tasks else []
+    return [puzzle for chunk in chunks for puzzle in chunk]
+
+# Generate n puzzles like generate_batch and write them, with their solutions
+# and difficulty tiers, to a packed 9x9 store (see store.py)
+# Returns the number of puzzles written
+def generate_store(path, n, difficulty=None, workers=None, seed=None, chunksize=16):
+    from store import write_store
+    return write_store(path, generate_batch(n, difficulty, workers, seed, chunksize))
+
 if __name__ == "__main__":
     k = 20
     puzzle_str = generate_sudoku_string(k)
     print("Generated Sudoku Puzzle as String:")
-    print(puzzle_str)
\ No newline at end of file
+    print(puzzle_str)
+    print("Generated 16x16 Puzzle as String:")
+    print(generate_sudoku_string(k * 256 // 81, order=4))
\ No newline at end of file
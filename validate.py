@@ -0,0 +1,247 @@
+from backend import BIT, BOX_OF, CELL_NAMES, UNITS
+
+# Validation of 9x9 puzzles and claimed solutions, for ingesting large corpora. validate() checks one board with a
+# single pass of bitmasks, validate_batch() many boards at once with NumPy. Both give the same answer for a board:
+# the first problem in the order of REASONS, and for an invalid board the offending cell. A duplicate is reported in
+# the first unit of backend.UNITS (rows, then columns, then boxes) that holds one, at the cell where a value shows up
+# for the second time. Boards are 81-character strings ('0' or '.' for blanks), bytes-like objects of cell values
+# (e.g. SudokuCSP.board) or, for validate_batch, an (N, 81) array of values as vectorized.to_digits and
+# store.PuzzleStore.digits give them. NumPy is only imported for validate_batch.
+
+# Reasons from most to least severe:
+#   'length'      not 81 cells
+#   'symbol'      a cell holds something other than '0'..'9' / '.'
+#   'duplicate'   a value twice in a row, column or box
+#   'incomplete'  a blank cell where a full grid was asked for (complete=True)
+#   'mismatch'    a solution that changes a given of its puzzle
+REASONS = ('ok', 'length', 'symbol', 'duplicate', 'incomplete', 'mismatch')
+OK, LENGTH, SYMBOL, DUPLICATE, INCOMPLETE, MISMATCH = range(len(REASONS))
+
+UNIT_NAMES = (tuple(f'row {r}' for r in range(9)) + tuple(f'column {c}' for c in range(9)) +
+              tuple(f'box {b}' for b in range(9)))      # index into UNITS -> name
+CELL_UNITS = tuple((cell // 9, 9 + cell % 9, 18 + BOX_OF[cell]) for cell in range(81))     # cell -> its units in UNITS
+
+# characters -> cell values, anything that is not a digit or '.' becomes INVALID
+INVALID = 0xFF
+DIGITS = bytes(int(chr(c)) if chr(c).isdigit() and c < 128 else 0 if c == ord('.') else INVALID for c in range(256))
+
+
+class Report:
+    # Outcome of validating one board, truthy exactly when it is valid. reason is one of REASONS, cell the index of
+    # the offending cell, unit the index into UNITS of the unit holding a duplicate, value the value at the cell
+    def __init__(self, reason='ok', cell=None, unit=None, value=None):
+        self.reason = reason
+        self.cell = cell
+        self.unit = unit
+        self.value = value
+
+    @property
+    def valid(self):
+        return self.reason == 'ok'
+
+    def __bool__(self):
+        return self.valid
+
+    def __eq__(self, other):
+        return isinstance(other, Report) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        return f'Report(reason={self.reason!r}, cell={self.cell}, unit={self.unit}, value={self.value})'
+
+    def __str__(self):      #e.g. 'duplicate 7 in row 4 at r4c5'
+        if self.reason == 'ok':
+            return 'ok'
+        if self.reason == 'length':
+            return 'length: a board has 81 cells'
+        where = f' at {CELL_NAMES[self.cell]}'
+        if self.reason == 'duplicate':
+            return f'duplicate {self.value} in {UNIT_NAMES[self.unit]}{where}'
+        if self.reason == 'mismatch':
+            return f'mismatch: {self.value} does not keep the given{where}'
+        return f'{self.reason}{where}'
+
+    def as_dict(self):
+        return {'valid': self.valid, 'reason': self.reason, 'cell': self.cell, 'unit': self.unit, 'value': self.value}
+
+
+def to_values(grid):        #board -> bytes of its 81 cell values, INVALID for unknown symbols
+    if isinstance(grid, str):
+        return grid.encode().translate(DIGITS)
+    return bytes(grid)
+
+
+def has_duplicate(values):      #one pass over the cells with a seen-mask per unit, the fast path of valid boards
+    seen = [0] * 27
+    for value, (r, c, b) in zip(values, CELL_UNITS):
+        if value:
+            bit = BIT[value]
+            if (seen[r] | seen[c] | seen[b]) & bit:
+                return True
+            seen[r] |= bit
+            seen[c] |= bit
+            seen[b] |= bit
+    return False
+
+
+def find_duplicate(values):     #(unit, cell) of the first duplicate in UNITS order, or None
+    for u, unit in enumerate(UNITS):
+        seen = 0
+        for cell in unit:
+            value = values[cell]
+            if value:
+                if seen & BIT[value]:
+                    return u, cell
+                seen |= BIT[value]
+    return None
+
+
+def validate(grid, complete=False, puzzle=None):
+    # Report on one board. complete=True asks for a full grid (a claimed solution), puzzle (any board form) for a
+    # grid that keeps every given of that puzzle
+    values = to_values(grid)
+    if len(values) != 81:
+        return Report('length')
+    if max(values) > 9:
+        cell = next(cell for cell, value in enumerate(values) if value > 9)
+        return Report('symbol', cell)
+    if has_duplicate(values):
+        unit, cell = find_duplicate(values)
+        return Report('duplicate', cell, unit, values[cell])
+    if complete and 0 in values:
+        return Report('incomplete', values.index(0))
+    if puzzle is not None:
+        givens = to_values(puzzle)
+        if len(givens) != 81:
+            raise ValueError(f'the puzzle has {len(givens)} cells, not 81')
+        for cell, (given, value) in enumerate(zip(givens, values)):
+            if given and given != value:
+                return Report('mismatch', cell, value=value)
+    return Report()
+
+
+class BatchReport:
+    # Outcome of validate_batch as NumPy arrays with one entry per board: reason (index into REASONS), cell, unit
+    # and value (-1 where they do not apply). report(k) / self[k] is the Report of board k
+    def __init__(self, reason, cell, unit, value):
+        self.reason = reason
+        self.cell = cell
+        self.unit = unit
+        self.value = value
+
+    @property
+    def valid(self):        #boolean array
+        return self.reason == OK
+
+    def __len__(self):
+        return len(self.reason)
+
+    def invalid(self):      #indices of the invalid boards
+        import numpy as np
+        return np.flatnonzero(self.reason)
+
+    def counts(self):       #{reason: boards}
+        import numpy as np
+        return dict(zip(REASONS, np.bincount(self.reason, minlength=len(REASONS)).tolist()))
+
+    def report(self, k):
+        reason = int(self.reason[k])
+        optional = lambda array: None if array[k] < 0 else int(array[k])
+        return Report(REASONS[reason], optional(self.cell), optional(self.unit), optional(self.value))
+
+    __getitem__ = report
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self.report(k)
+
+
+def digit_array(grids):
+    # (N, 81) uint8 array of cell values and a boolean array marking boards that do not have 81 cells (their rows
+    # are left blank). grids is such an array already, or a list of boards in any form validate() takes
+    import numpy as np
+    if isinstance(grids, np.ndarray):
+        if grids.ndim != 2 or grids.shape[1] != 81:
+            raise ValueError(f'expected an (N, 81) array, got shape {grids.shape}')
+        return grids.astype(np.uint8, copy=False), np.zeros(len(grids), dtype=bool)
+    rows = [to_values(grid) for grid in grids]
+    bad_length = np.array([len(row) != 81 for row in rows], dtype=bool)
+    data = b''.join(bytes(81) if bad else row for row, bad in zip(rows, bad_length))
+    return np.frombuffer(data, dtype=np.uint8).reshape(len(rows), 81), bad_length
+
+
+def validate_batch(grids, complete=False, puzzles=None, block=65536):
+    # validate() for many boards at once. Works through block boards at a time, holding a few (block, 27, 9)
+    # arrays. Returns a BatchReport
+    import numpy as np
+    digits, bad_length = digit_array(grids)
+    givens = None
+    if puzzles is not None:
+        givens, bad_givens = digit_array(puzzles)
+        if len(givens) != len(digits) or bad_givens.any():
+            raise ValueError('puzzles must be one 81-cell board per grid')
+
+    n = len(digits)
+    reason = np.where(bad_length, LENGTH, OK).astype(np.uint8)
+    cell = np.full(n, -1, dtype=np.int16)
+    unit = np.full(n, -1, dtype=np.int16)
+    for start in range(0, n, block):
+        part = slice(start, min(n, start + block))
+        _check_block(digits[part], reason[part], cell[part], unit[part], complete,
+                     givens[part] if givens is not None else None)
+
+    rows = np.flatnonzero((reason == DUPLICATE) | (reason == MISMATCH))     #the reports that name a value
+    value = np.full(n, -1, dtype=np.int16)
+    value[rows] = digits[rows, cell[rows]]
+    return BatchReport(reason, cell, unit, value)
+
+
+UNIT_INDEX = None       #UNITS as an intp array, built on the first batch
+LATER = None            #LATER[k, j]: position j comes before position k of a unit
+
+
+def _check_block(digits, reason, cell, unit, complete, givens):     #fill in the reports of one block in place
+    import numpy as np
+    global UNIT_INDEX, LATER
+    if UNIT_INDEX is None:
+        UNIT_INDEX = np.array(UNITS, dtype=np.intp)
+        LATER = np.tril(np.ones((9, 9), dtype=bool), -1)
+
+    def report(found, code, first_cell):       #boards still ok that have this problem get it
+        hit = found & (reason == OK)
+        reason[hit] = code
+        cell[hit] = first_cell[hit]
+        return hit
+
+    bad_symbol = digits > 9
+    report(bad_symbol.any(axis=1), SYMBOL, bad_symbol.argmax(axis=1))
+
+    units = digits[:, UNIT_INDEX]                                           # (n, 27, 9)
+    ordered = np.sort(units, axis=2)
+    repeated = ((ordered[:, :, 1:] == ordered[:, :, :-1]) & (ordered[:, :, 1:] > 0)).any(axis=2)     # (n, 27)
+    boards = np.flatnonzero(repeated.any(axis=1) & (reason == OK))
+    if len(boards):
+        first_unit = repeated[boards].argmax(axis=1)
+        values = units[boards, first_unit]                                  # (m, 9)
+        seen_before = ((values[:, :, None] == values[:, None, :]) & LATER & (values[:, :, None] > 0)).any(axis=2)
+        reason[boards] = DUPLICATE
+        unit[boards] = first_unit
+        cell[boards] = UNIT_INDEX[first_unit, seen_before.argmax(axis=1)]
+
+    if complete:
+        blank = digits == 0
+        report(blank.any(axis=1), INCOMPLETE, blank.argmax(axis=1))
+    if givens is not None:
+        changed = (givens > 0) & (givens != digits)
+        report(changed.any(axis=1), MISMATCH, changed.argmax(axis=1))
+
+
+# Example usage
+if __name__ == "__main__":
+    import const
+    from backend import SudokuCSP
+    csp = SudokuCSP(const.EXPERT_PUZZLE, logging='off')
+    solution = csp.solve().solution
+    broken = solution[:4] + solution[5] + solution[4] + solution[6:]
+    for name, grid in (('puzzle', const.EXPERT_PUZZLE), ('solution', solution), ('swapped cells', broken)):
+        print(f'{name}: {validate(grid, complete=name != "puzzle", puzzle=const.EXPERT_PUZZLE)}')
+    print(validate_batch([const.EXPERT_PUZZLE, broken, '123']).counts())
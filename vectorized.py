@@ -0,0 +1,104 @@
+import numpy as np
+
+from backend import PEERS, UNITS, POPCOUNT, LOWEST_VALUE, SudokuCSP
+
+# Batch constraint propagation with NumPy. N puzzles are held as an (N, 81) uint16 array of candidate masks
+# (bit v - 1 set <=> value v possible, the same encoding as SudokuCSP.domains) and naked / hidden singles are
+# eliminated for all of them at once. Puzzles left unsolved go to SudokuCSP's backtracking.
+
+PEER_INDEX = np.array(PEERS, dtype=np.intp)         # (81, 20)
+UNIT_INDEX = np.array(UNITS, dtype=np.intp)         # (27, 9): rows, columns, boxes
+POP = np.array(POPCOUNT, dtype=np.uint8)            # mask -> domain size
+LOWEST = np.array(LOWEST_VALUE, dtype=np.uint8)     # mask -> smallest value
+BITS = np.array([0] + [1 << (v - 1) for v in range(1, 10)], dtype=np.uint16)     # value -> mask
+ALL = np.uint16(0x1FF)
+PARSE = bytes.maketrans(b'.0123456789', bytes([0]) + bytes(range(10)))          # '.' and '0' -> 0
+
+
+def to_digits(puzzles):        #list of 81-character puzzle strings -> (N, 81) uint8 array of 0..9
+    data = ''.join(puzzles).encode().translate(PARSE)
+    digits = np.frombuffer(data, dtype=np.uint8).reshape(len(puzzles), 81)
+    if (digits > 9).any():
+        raise ValueError("puzzles may only contain digits and '.'")
+    return digits
+
+
+def to_masks(digits):          #givens become singleton masks, blanks hold every value
+    return np.where(digits > 0, BITS[digits], ALL).astype(np.uint16)
+
+
+def eliminate_naked_singles(masks):      #remove every solved cell's value from its 20 peers
+    solved = POP[masks] == 1
+    peer_values = np.where(solved, masks, 0)[:, PEER_INDEX]             # (N, 81, 20)
+    taken = np.bitwise_or.reduce(peer_values, axis=2)
+    return np.where(solved, masks, masks & ~taken)
+
+
+def assign_hidden_singles(masks):        #a value that fits only one cell of a unit goes in that cell
+    units = masks[:, UNIT_INDEX]                                        # (N, 27, 9)
+    once = np.zeros(units.shape[:2], dtype=np.uint16)
+    twice = np.zeros_like(once)
+    for k in range(9):
+        twice |= once & units[:, :, k]
+        once |= units[:, :, k]
+    hidden = units & (once & ~twice)[:, :, None]                        # values only this cell can take in the unit
+
+    per_cell = np.zeros_like(masks)
+    for t in range(3):      #scatter each unit type back to cell order and combine the three
+        block = slice(9 * t, 9 * t + 9)
+        scattered = np.empty_like(masks)
+        scattered[:, UNIT_INDEX[block].ravel()] = hidden[:, block].reshape(len(masks), 81)
+        per_cell |= scattered
+    # contradictions: a value with no cell left in some unit, or one cell forced to take two values
+    broken = (once != ALL).any(axis=1) | (POP[per_cell] > 1).any(axis=1)
+    return np.where(per_cell != 0, per_cell, masks), broken
+
+
+def propagate(masks):
+    # Apply naked and hidden singles until no puzzle changes any more. Returns the propagated masks and a
+    # boolean array that is False for puzzles found to be contradictory. Work shrinks to the puzzles still changing
+    masks = masks.copy()
+    consistent = np.ones(len(masks), dtype=bool)
+    active = np.arange(len(masks))
+    while len(active):
+        current = masks[active]
+        updated = eliminate_naked_singles(current)
+        updated, broken = assign_hidden_singles(updated)
+        broken |= (updated == 0).any(axis=1)
+        changed = (updated != current).any(axis=1) & ~broken
+        masks[active] = updated
+        consistent[active[broken]] = False
+        active = active[changed]
+    return masks, consistent
+
+
+def solve_batch(puzzles, engine='ac3', block=4096):
+    # Solve a list of puzzle strings: vectorized propagation first, SudokuCSP backtracking for the rest.
+    # Returns the solution strings in input order, None for puzzles without a solution
+    solutions = []
+    for start in range(0, len(puzzles), block):
+        masks, consistent = propagate(to_masks(to_digits(puzzles[start:start + block])))
+        done = consistent & (POP[masks] == 1).all(axis=1)
+        values = np.where(POP[masks] == 1, LOWEST[masks], 0) + ord('0')
+
+        for k in range(len(masks)):
+            board = values[k].tobytes().decode()
+            if done[k]:
+                solutions.append(board)
+            elif not consistent[k]:
+                solutions.append(None)
+            else:       #hand the propagated board, with every cell propagation fixed, to the backtracking search
+                csp = SudokuCSP(board, logging='off')
+                solved = csp.solve(engine)
+                solutions.append(csp.grid if solved else None)
+    return solutions
+
+
+# Example usage
+if __name__ == "__main__":
+    import const
+    names = ['EASY_PUZZLE', 'MEDIUM_PUZZLE', 'HARD_PUZZLE', 'EXPERT_PUZZLE', 'EXTREME_PUZZLE', 'MASTER_PUZZLE']
+    puzzles = [getattr(const, name) for name in names]
+    masks, consistent = propagate(to_masks(to_digits(puzzles)))
+    for name, mask, solution in zip(names, masks, solve_batch(puzzles)):
+        print(f'{name}: {int((POP[mask] == 1).sum())}/81 cells fixed by propagation -> {solution}')